@@ -0,0 +1,228 @@
+"""
+API benchmark: /api/status, gRPC-web GetStatus, /api/subscribe and /api/unsubscribe.
+
+Runs the FastAPI app in-process (offline, no bots, no Redis) against a local
+stand-in for ztoe.com.ua that serves bench/fixtures/ztoe_unhooking.html, and
+measures throughput and latency percentiles at increasing concurrency.
+
+    python bench/bench_api.py [--concurrency 1,8,32,64] [--requests 400]
+                              [--mode cached|live] [--out report.json]
+
+`cached` (CAN_CACHE=true, the production setting) serves statuses from the
+schedule cache, `live` scrapes the stand-in on every status request.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "ztoe_unhooking.html"
+
+ENDPOINTS = ["status", "grpc_status", "subscribe", "unsubscribe"]
+QUEUES = ["1.1", "1.2", "2.1", "2.2", "3.1", "3.2", "4.1", "4.2", "5.1", "5.2", "6.1", "6.2"]
+
+
+async def start_upstream(hits: list[int]):
+    """Serve the recorded page on a free local port, returns (runner, url)."""
+    from aiohttp import web
+
+    page = FIXTURE.read_text(encoding="utf-8")
+
+    async def unhooking(_request):
+        hits[0] += 1
+        return web.Response(text=page, content_type="text/html", charset="utf-8")
+
+    upstream = web.Application()
+    upstream.router.add_get("/unhooking-search.php", unhooking)
+    runner = web.AppRunner(upstream, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/unhooking-search.php"
+
+
+def _grpc_frame(message: bytes) -> bytes:
+    return b"\x00" + len(message).to_bytes(4, "big") + message
+
+
+def _subscription(level: int, seq: int) -> dict:
+    return {
+        "endpoint": f"https://push.bench.invalid/{level}/{seq}",
+        "keys": {"p256dh": "BENCH-p256dh", "auth": "BENCH-auth"},
+    }
+
+
+def make_request(name: str, level: int, status_pb2):
+    """Return a coroutine factory `(client, seq) -> response` for the endpoint."""
+    if name == "status":
+        return lambda client, seq: client.get("/api/status", params={"queue": QUEUES[seq % len(QUEUES)]})
+
+    if name == "grpc_status":
+        frames = [_grpc_frame(status_pb2.StatusRequest(queue=queue).SerializeToString()) for queue in QUEUES]
+        headers = {"content-type": "application/grpc-web+proto", "x-grpc-web": "1"}
+        return lambda client, seq: client.post(
+            "/api/grpc/StatusService/GetStatus", content=frames[seq % len(frames)], headers=headers
+        )
+
+    if name == "subscribe":
+        return lambda client, seq: client.post(
+            "/api/subscribe",
+            json={"subscription": _subscription(level, seq), "queue": QUEUES[seq % len(QUEUES)]},
+        )
+
+    # removes what the subscribe run at the same concurrency added
+    return lambda client, seq: client.post("/api/unsubscribe", json={"subscription": _subscription(level, seq)})
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    # nearest rank
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+async def run_level(client, request, total: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    next_seq = 0
+
+    async def worker():
+        nonlocal next_seq, errors
+        while next_seq < total:
+            seq = next_seq
+            next_seq += 1
+            started = time.perf_counter()
+            try:
+                response = await request(client, seq)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+        "p90_ms": round(_percentile(ordered, 0.90) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+def _git_commit() -> str | None:
+    proc = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=False
+    )
+    return proc.stdout.strip() or None
+
+
+async def bench(args) -> dict:
+    hits = [0]
+    upstream, url = await start_upstream(hits)
+
+    # the app reads its configuration at import time
+    os.environ.update({
+        "ZTOE_URL": url,
+        "OFFLINE": "true",
+        "BOT_ONLINE": "false",
+        "HELP_BOT_TOKEN": "",
+        "REDIS_URL": "",
+        "CAN_CACHE": "true" if args.mode == "cached" else "false",
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    import httpx
+    import main
+    from proto import status_pb2
+    from untils import readiness
+
+    await main.start()
+    try:
+        deadline = time.monotonic() + 30
+        while not readiness.is_ready():
+            if time.monotonic() > deadline:
+                raise SystemExit(f"app did not become ready: {readiness.status()}")
+            await asyncio.sleep(0.05)
+
+        results = {name: [] for name in args.endpoints}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in args.endpoints:
+                warmup = make_request(name, -1, status_pb2)
+                for seq in range(min(20, args.requests)):
+                    await warmup(client, seq)
+                if name == "subscribe":
+                    cleanup = make_request("unsubscribe", -1, status_pb2)
+                    for seq in range(min(20, args.requests)):
+                        await cleanup(client, seq)
+
+                for level in args.concurrency:
+                    result = await run_level(client, make_request(name, level, status_pb2), args.requests, level)
+                    results[name].append(result)
+                    print(
+                        f"{name:12s} c={level:<4d} {result['throughput_rps']:>9.1f} rps  "
+                        f"p50={result['p50_ms']:.2f}ms  p99={result['p99_ms']:.2f}ms  errors={result['errors']}",
+                        file=sys.stderr,
+                    )
+    finally:
+        await main.stop()
+        await upstream.cleanup()
+
+    return {
+        "benchmark": "api",
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "mode": args.mode,
+        "requests_per_level": args.requests,
+        "upstream_hits": hits[0],
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32,64", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=400, help="requests per endpoint and level")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--mode", choices=("cached", "live"), default="cached")
+    parser.add_argument("--out", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    args.concurrency = [int(level) for level in args.concurrency.split(",") if level]
+    args.endpoints = [name for name in args.endpoints.split(",") if name]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(bench(args))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Notification fan-out load test with fake Web Push and Telegram Bot API servers.
+
+Seeds synthetic subscribers into `untils.subcription`, points the notifier at
+local fake services (run on their own thread and loop, since `webpush` is a
+blocking call) and drives `notify_all` or `send_push_all`. Reports duration,
+messages per second and whether exactly the gone subscribers were pruned.
+
+    python bench/fanout.py [--push 10000] [--telegram 10000] [--latency-ms 5]
+                           [--gone-rate 0.05] [--error-rate 0.01]
+                           [--mode all|queue] [--queue 1.1] [--out report.json]
+
+Push endpoints answer 410 (gone, must be pruned) or 500 (must be kept);
+Telegram chats answer 403 "bot was blocked" (pruned) or 500 (kept).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+QUEUES = [11, 12, 21, 22, 31, 32, 41, 42, 51, 52, 61, 62]
+BOT_TOKEN = "123456:BENCH-fanout"
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def make_keys() -> tuple[str, dict]:
+    """A VAPID private key and one real subscriber key pair, so every push is encrypted for real."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    vapid = ec.generate_private_key(ec.SECP256R1())
+    vapid_private = _b64(vapid.private_numbers().private_value.to_bytes(32, "big"))
+
+    client = ec.generate_private_key(ec.SECP256R1())
+    p256dh = client.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    return vapid_private, {"p256dh": _b64(p256dh), "auth": _b64(os.urandom(16))}
+
+
+def make_plan(count: int, gone_rate: float, error_rate: float, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    plan = []
+    for _ in range(count):
+        roll = rng.random()
+        plan.append("gone" if roll < gone_rate else "error" if roll < gone_rate + error_rate else "ok")
+    return plan
+
+
+class FakeServices(threading.Thread):
+    """Fake push service and Bot API on one aiohttp app, on a thread of its own."""
+
+    def __init__(self, push_plan: list[str], telegram_plan: list[str], latency: float):
+        super().__init__(name="fake-services", daemon=True)
+        self.push_plan = push_plan
+        self.telegram_plan = telegram_plan
+        self.latency = latency
+        self.received: Counter = Counter()
+        self.base_url = ""
+        self._ready = threading.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._runner = None
+
+    async def _push(self, request):
+        from aiohttp import web
+
+        await asyncio.sleep(self.latency)
+        outcome = self.push_plan[int(request.match_info["seq"])]
+        self.received[f"push_{outcome}"] += 1
+        if outcome == "gone":
+            return web.Response(status=410, text="push subscription has unsubscribed or expired")
+        if outcome == "error":
+            return web.Response(status=500, text="internal error")
+        return web.Response(status=201)
+
+    async def _telegram(self, request):
+        from aiohttp import web
+
+        await asyncio.sleep(self.latency)
+        if request.match_info["method"].lower() != "sendmessage":
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        outcome = self.telegram_plan[chat_id - 1]
+        self.received[f"telegram_{outcome}"] += 1
+        if outcome == "gone":
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                status=403,
+            )
+        if outcome == "error":
+            return web.json_response(
+                {"ok": False, "error_code": 500, "description": "Internal Server Error"}, status=500
+            )
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": self.received["telegram_ok"],
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            },
+        })
+
+    async def _start(self):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post("/push/{seq}", self._push)
+        app.router.add_post("/bot{token}/{method}", self._telegram)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    def run(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._start())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start_and_wait(self):
+        self.start()
+        self._ready.wait()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self.join(timeout=10)
+
+
+def _git_commit() -> str | None:
+    proc = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=False
+    )
+    return proc.stdout.strip() or None
+
+
+def _pruning(plan: list[str], seeded: set, remaining: set, targeted: set) -> dict:
+    expected = {key for key in targeted if plan[key] == "gone"}
+    pruned = seeded - remaining
+    return {
+        "expected": len(expected),
+        "pruned": len(pruned),
+        "missed": len(expected - pruned),
+        "unexpected": len(pruned - expected),
+        "ok": pruned == expected,
+    }
+
+
+async def run(args) -> dict:
+    vapid_private, keys = make_keys()
+    push_plan = make_plan(args.push, args.gone_rate, args.error_rate, args.seed)
+    telegram_plan = make_plan(args.telegram, args.gone_rate, args.error_rate, args.seed + 1)
+
+    services = FakeServices(push_plan, telegram_plan, args.latency_ms / 1000)
+    services.start_and_wait()
+
+    # the notifier and the bot read their configuration at import time
+    os.environ.update({
+        "VAPID_PRIVATE_KEY": vapid_private,
+        "BOT_ONLINE": "true",
+        "BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": services.base_url,
+        "OFFLINE": "true",
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from untils import notifier, subcription
+    import bot.bot as telegram_bot
+
+    subcription.set_db_enabled(False)
+    subcription.replace_push_subscriptions([
+        {"endpoint": f"{services.base_url}/push/{seq}", "keys": keys, "queue": QUEUES[seq % len(QUEUES)]}
+        for seq in range(args.push)
+    ])
+    subcription.replace_telegram_subscriptions([
+        {"id": seq + 1, "queue": QUEUES[seq % len(QUEUES)]} for seq in range(args.telegram)
+    ])
+
+    queue = subcription.queue_code_from_input(args.queue) if args.mode == "queue" else None
+    targeted_push = {seq for seq in range(args.push) if queue is None or QUEUES[seq % len(QUEUES)] == queue}
+    targeted_telegram = {seq for seq in range(args.telegram) if queue is None or QUEUES[seq % len(QUEUES)] == queue}
+
+    started = time.perf_counter()
+    try:
+        if queue is None:
+            await notifier.notify_all("Бенчмарк", "Перевірка розсилки")
+        else:
+            await notifier.send_push_all("Бенчмарк", "Перевірка розсилки", queue)
+        elapsed = time.perf_counter() - started
+    finally:
+        if telegram_bot.bot is not None:
+            await telegram_bot.bot.session.close()
+        services.stop()
+
+    remaining_push = {
+        int(item["endpoint"].rsplit("/", 1)[1]) for item in subcription.iter_push_subs()
+    }
+    remaining_telegram = {item["id"] - 1 for item in subcription.iter_telegram_subs()}
+    attempted = len(targeted_push) + len(targeted_telegram)
+
+    return {
+        "benchmark": "fanout",
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mode": args.mode,
+        "queue": subcription.queue_label(queue) if queue is not None else None,
+        "config": {
+            "push": args.push,
+            "telegram": args.telegram,
+            "latency_ms": args.latency_ms,
+            "gone_rate": args.gone_rate,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+        },
+        "seconds": round(elapsed, 3),
+        "messages": attempted,
+        "messages_per_second": round(attempted / elapsed, 1) if elapsed else 0.0,
+        "received": dict(services.received),
+        "pruning": {
+            "push": _pruning(push_plan, set(range(args.push)), remaining_push, targeted_push),
+            "telegram": _pruning(telegram_plan, set(range(args.telegram)), remaining_telegram, targeted_telegram),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--push", type=int, default=10_000, help="synthetic push subscribers")
+    parser.add_argument("--telegram", type=int, default=10_000, help="synthetic Telegram subscribers")
+    parser.add_argument("--latency-ms", type=float, default=5, help="fake service response delay")
+    parser.add_argument("--gone-rate", type=float, default=0.05, help="share answered 410 / blocked")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="share answered 500")
+    parser.add_argument("--mode", choices=("all", "queue"), default="all", help="notify_all or send_push_all")
+    parser.add_argument("--queue", default="1.1", help="target queue for --mode queue")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the per-message failure logs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    report = asyncio.run(run(args))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+    ok = report["pruning"]["push"]["ok"] and report["pruning"]["telegram"]["ok"]
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
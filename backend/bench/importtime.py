@@ -0,0 +1,94 @@
+"""
+Import-time budget check for the API worker.
+
+Runs `python -X importtime -c "import main"` in a clean interpreter and fails
+when the cumulative import time of `main` exceeds the budget, or when a
+subsystem that must load lazily (bots, push stack, DB layer, scraper) is
+imported eagerly.
+
+    python bench/importtime.py [--budget-ms 1000] [--runs 3] [--out report.json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# must not be imported by `import main` whatever the configuration
+LAZY_MODULES = [
+    "aiogram",
+    "pywebpush",
+    "sqlalchemy",
+    "asyncpg",
+    "bs4",
+    "aiohttp",
+    "apscheduler",
+    "google.protobuf",
+]
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure() -> tuple[int, set[str]]:
+    """Return (cumulative microseconds for `main`, imported module names)."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"`import main` failed:\n{proc.stderr[-2000:]}")
+
+    total = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        modules.add(match.group(4))
+        if match.group(4) == "main":
+            total = int(match.group(2))
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1000")))
+    parser.add_argument("--runs", type=int, default=3, help="best of N, the first run also warms the OS cache")
+    parser.add_argument("--out", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    samples = []
+    modules: set[str] = set()
+    for _ in range(max(1, args.runs)):
+        total, modules = measure()
+        samples.append(total / 1000)
+
+    eager = sorted(name for name in LAZY_MODULES if name in modules)
+    best = min(samples)
+    report = {
+        "import_ms": round(best, 1),
+        "samples_ms": [round(sample, 1) for sample in samples],
+        "budget_ms": args.budget_ms,
+        "eager_modules": eager,
+        "ok": best <= args.budget_ms and not eager,
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,37 @@ import os
 
 import bot.handlers.queue as queue
 import bot.handlers.start as start
+from untils import tg_session
+from untils import webhook
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 dp = Dispatcher()
-bot = Bot(BOT_TOKEN)
+bot: Bot | None = None
 
 async def start_bot():
     dp.include_routers(queue.router, start.router)
-    await dp.start_polling(bot)
 
-def get_bot() -> Bot:
-    return bot 
\ No newline at end of file
+    if webhook.ENABLED:
+        await webhook.serve("bot", get_bot(), dp)
+        return
+
+    # a webhook left by a previous deploy would make getUpdates fail
+    await get_bot().delete_webhook()
+    await dp.start_polling(get_bot())
+
+async def stop_bot():
+    try:
+        await dp.stop_polling()
+    except RuntimeError:
+        # polling was never started
+        pass
+    if bot is not None:
+        await bot.session.close()
+
+def get_bot() -> Bot | None:
+    # created on first use so importing the module stays cheap
+    global bot
+    if bot is None and BOT_TOKEN:
+        bot = Bot(BOT_TOKEN, session=tg_session.make_session())
+    return bot
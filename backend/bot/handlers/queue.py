@@ -1,12 +1,13 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.filters import Command, CommandObject
+from datetime import datetime
 import logging
 
 import untils.db_multi as dbM
 import db.orm.utils as db
 import untils.redis_db as redisdb
-from untils import subcription, tools, variebles
+from untils import renders, subcription, tools, variebles
 
 import bot.keyboards.queueKeyboard as keyboard
 
@@ -23,6 +24,33 @@ QUEUE_MESSAGE = """
 async def bot_queue_cmd(msg: Message):
     await msg.answer(QUEUE_MESSAGE)
 
+@router.message(Command("status"))
+async def bot_status_cmd(msg: Message, command: CommandObject):
+    if command.args:
+        label = command.args.strip()
+        if label not in variebles.QUEUE_LABELS.values():
+            await msg.answer("Невідома черга, приклад: /status 1.1")
+            return
+        queue = subcription.queue_code_from_input(label)
+    else:
+        queue = subcription.telegram_queue(msg.from_user.id)
+        if queue is None:
+            await msg.answer("Вкажіть чергу, наприклад /status 1.1, або підпишіться через /set_queue")
+            return
+
+    # rendered once per schedule change, shared by everyone on the queue
+    render = renders.get_render(queue)
+    if render is None:
+        await msg.answer("Графік ще завантажується, спробуйте за хвилину")
+        return
+
+    caption = f"{render['text']}\n{renders.current_state(render['status'], datetime.now())}"
+    photo = render["file_id"] or BufferedInputFile(render["png"], filename=f"queue_{variebles.QUEUE_LABELS[queue]}.png")
+    sent = await msg.answer_photo(photo, caption=caption)
+
+    if not render["file_id"] and sent.photo:
+        renders.remember_file_id(queue, render["version"], sent.photo[-1].file_id)
+
 @router.message(Command("set_queue"))
 async def bot_set_queue(msg: Message):
     await msg.answer("Виберіть чергу", reply_markup=keyboard.queue_select_kb)
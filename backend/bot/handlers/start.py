@@ -7,6 +7,7 @@ router = Router()
 HELP_MESSAGE = """
 /help - показує цей список
 /queue - посилання на сайт з графіками відключень світла
+/status - графік відключень вашої черги на сьогодні (або /status 1.1)
 /set_queue - увімкнути та вибрати або оновити чергу для сповіщеннь
 /delete_queue - вимкнути сповіщення
 """
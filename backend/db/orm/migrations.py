@@ -0,0 +1,155 @@
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+import db.orm.session as session_mod
+from db.orm.base import Base
+import db.orm.models  # noqa: F401 - registers the tables on Base.metadata
+
+log = logging.getLogger(__name__)
+
+# any constant works, it only has to be the same in every worker
+_MIGRATION_LOCK_KEY = 72_515_001
+
+
+def _baseline(sync_conn):
+    Base.metadata.create_all(sync_conn, checkfirst=True)
+    # databases created before queue_id existed
+    sync_conn.execute(text("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS queue_id INTEGER DEFAULT 0"))
+
+
+def _hot_lookup_indexes(sync_conn):
+    sync_conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_support_tickets_user_created "
+        "ON support_tickets (user_id, created_at)"
+    ))
+    sync_conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_support_ticket_messages_ticket_id "
+        "ON support_ticket_messages (ticket_id)"
+    ))
+    sync_conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_queue_id "
+        "ON subscriptions (queue_id)"
+    ))
+
+
+# 32-bit md5 prefix as a non-negative bigint, matches subcription.push_item_hash/tg_item_hash
+_PUSH_HASH = (
+    "('x' || lpad(substr(md5({row}.endpoint || chr(10) || {row}.p256dh || chr(10) || {row}.auth), 1, 8), 16, '0'))"
+    "::bit(64)::bigint"
+)
+_TG_HASH = "('x' || lpad(substr(md5({row}.tg_id::text), 1, 8), 16, '0'))::bit(64)::bigint"
+
+
+def _subscription_digests(sync_conn):
+    """
+    Per-queue (count, hash sum) rows kept by triggers in the writing transaction,
+    so the reconciler reads O(queues) rows instead of hashing every subscriber.
+    """
+    sync_conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS subscription_digests ("
+        "kind TEXT NOT NULL, "
+        "queue_id INTEGER NOT NULL, "
+        "count BIGINT NOT NULL DEFAULT 0, "
+        "total BIGINT NOT NULL DEFAULT 0, "
+        "PRIMARY KEY (kind, queue_id))"
+    ))
+    sync_conn.execute(text(
+        "CREATE OR REPLACE FUNCTION svitlo_bump_digest(p_kind TEXT, p_queue INTEGER, p_sign INTEGER, p_hash BIGINT) "
+        "RETURNS void AS $$ "
+        "INSERT INTO subscription_digests AS d (kind, queue_id, count, total) "
+        "VALUES (p_kind, coalesce(p_queue, 0), p_sign, p_sign * p_hash) "
+        "ON CONFLICT (kind, queue_id) DO UPDATE "
+        "SET count = d.count + EXCLUDED.count, total = d.total + EXCLUDED.total "
+        "$$ LANGUAGE sql"
+    ))
+
+    for table, kind, item_hash in (("subscriptions", "push", _PUSH_HASH), ("tg_sub", "telegram", _TG_HASH)):
+        function = f"svitlo_{table}_digest"
+        sync_conn.execute(text(
+            f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ "
+            "BEGIN "
+            "IF TG_OP = 'TRUNCATE' THEN "
+            f"DELETE FROM subscription_digests WHERE kind = '{kind}'; RETURN NULL; "
+            "END IF; "
+            "IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+            f"PERFORM svitlo_bump_digest('{kind}', OLD.queue_id, -1, {item_hash.format(row='OLD')}); "
+            "END IF; "
+            "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            f"PERFORM svitlo_bump_digest('{kind}', NEW.queue_id, 1, {item_hash.format(row='NEW')}); "
+            "END IF; "
+            "RETURN NULL; "
+            "END $$ LANGUAGE plpgsql"
+        ))
+        # creating the triggers locks out writers until the backfill below commits
+        sync_conn.execute(text(f"DROP TRIGGER IF EXISTS {function} ON {table}"))
+        sync_conn.execute(text(
+            f"CREATE TRIGGER {function} AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {function}()"
+        ))
+        sync_conn.execute(text(f"DROP TRIGGER IF EXISTS {function}_truncate ON {table}"))
+        sync_conn.execute(text(
+            f"CREATE TRIGGER {function}_truncate AFTER TRUNCATE ON {table} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()"
+        ))
+
+        sync_conn.execute(text(f"DELETE FROM subscription_digests WHERE kind = '{kind}'"))
+        sync_conn.execute(text(
+            "INSERT INTO subscription_digests (kind, queue_id, count, total) "
+            f"SELECT '{kind}', coalesce(queue_id, 0), count(*), coalesce(sum({item_hash.format(row=table)}), 0) "
+            f"FROM {table} GROUP BY coalesce(queue_id, 0)"
+        ))
+
+
+# (version, name, step) - append only, never renumber
+MIGRATIONS = [
+    (1, "baseline", _baseline),
+    (2, "hot lookup indexes", _hot_lookup_indexes),
+    (3, "subscription digests", _subscription_digests),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def current_version() -> int:
+    async with session_mod.engine.connect() as conn:
+        try:
+            res = await conn.execute(text("SELECT max(version) FROM schema_version"))
+        except ProgrammingError:
+            # schema_version does not exist yet
+            return 0
+        return res.scalar() or 0
+
+
+async def migrate() -> int:
+    """
+    Apply pending migrations. When the schema is current this is one query;
+    otherwise workers serialize on an advisory lock and re-check the version.
+    """
+    version = await current_version()
+    if version >= LATEST_VERSION:
+        return version
+
+    async with session_mod.engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+        version = (await conn.execute(text("SELECT max(version) FROM schema_version"))).scalar() or 0
+
+        for number, name, step in MIGRATIONS:
+            if number <= version:
+                continue
+            log.info("applying migration %s: %s", number, name)
+            await conn.run_sync(step)
+            await conn.execute(
+                text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+                {"version": number, "name": name},
+            )
+            version = number
+
+    return version
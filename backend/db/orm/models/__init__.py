@@ -2,6 +2,7 @@ from .user import User
 from .subscription import Subscription
 from .tg_sub import TgSub
 from .support import SupportAdmin, SupportBan, SupportTicket, SupportTicketMessage
+from .schedule import ScheduleDailyStats, ScheduleSnapshot
 
 __all__ = [
     "User",
@@ -11,4 +12,6 @@ __all__ = [
     "SupportBan",
     "SupportTicket",
     "SupportTicketMessage",
+    "ScheduleSnapshot",
+    "ScheduleDailyStats",
 ]
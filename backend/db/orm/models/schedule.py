@@ -0,0 +1,30 @@
+from sqlalchemy import BigInteger, Column, Date, DateTime, Index, Integer, SmallInteger, func
+
+from db.orm.base import Base
+
+
+class ScheduleSnapshot(Base):
+    """
+    Append-only history of the outage schedule. A row is written only when a
+    queue's schedule for the day changes; slot i is an outage when bit i of mask is set.
+    """
+    __tablename__ = "schedule_snapshots"
+    __table_args__ = (Index("ix_schedule_snapshots_queue_day", "queue_id", "day"),)
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    queue_id = Column(SmallInteger, nullable=False)
+    day = Column(Date, nullable=False)
+    slots = Column(SmallInteger, nullable=False)
+    mask = Column(BigInteger, nullable=False)
+    captured_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ScheduleDailyStats(Base):
+    """Per-queue daily rollup of the latest schedule, kept up to date on every change."""
+    __tablename__ = "schedule_daily_stats"
+
+    queue_id = Column(SmallInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    outage_minutes = Column(Integer, nullable=False, default=0)
+    longest_outage_minutes = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
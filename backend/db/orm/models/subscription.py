@@ -11,7 +11,7 @@ class Subscription(Base):
     endpoint = Column(Text, unique=True, nullable=False)
     p256dh = Column(Text, nullable=False)
     auth = Column(Text, nullable=False)
-    queue_id = Column(Integer, nullable=False, default=0)
+    queue_id = Column(Integer, nullable=False, default=0, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
 
     user = relationship("User", back_populates="subscription")
@@ -1,4 +1,4 @@
-from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, Text, func
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Index, Integer, Text, func
 
 from db.orm.base import Base
 
@@ -13,6 +13,7 @@ class SupportAdmin(Base):
 
 class SupportTicket(Base):
   __tablename__ = "support_tickets"
+  __table_args__ = (Index("ix_support_tickets_user_created", "user_id", "created_at"),)
 
   id = Column(Integer, primary_key=True, autoincrement=True)
   user_id = Column(BigInteger, nullable=False)
@@ -38,7 +39,7 @@ class SupportTicketMessage(Base):
   __tablename__ = "support_ticket_messages"
 
   id = Column(Integer, primary_key=True, autoincrement=True)
-  ticket_id = Column(Integer, nullable=False)
+  ticket_id = Column(Integer, nullable=False, index=True)
   admin_id = Column(BigInteger, nullable=False)
   chat_id = Column(BigInteger, nullable=False)
   message_id = Column(BigInteger, nullable=False)
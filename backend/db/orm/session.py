@@ -1,5 +1,7 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
+import time
 
 DB_USER = os.getenv("DB_USER")
 DB_PASS = os.getenv("DB_PASS")
@@ -7,11 +9,68 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME")
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
 _has_db_config = all([DB_USER, DB_PASS, DB_HOST, DB_NAME])
 
+
+class PoolStats:
+    """Checkout counters collected by InstrumentedPool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that measures how long callers wait for a connection."""
+
+    def _do_get(self):
+        pool_stats.waiting += 1
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.waiting -= 1
+
+        # only successful checkouts, a timeout would pull the average towards DB_POOL_TIMEOUT
+        elapsed = time.perf_counter() - started
+        pool_stats.checkouts += 1
+        pool_stats.wait_total += elapsed
+        pool_stats.wait_max = max(pool_stats.wait_max, elapsed)
+        return connection
+
+
 if _has_db_config:
     db_url = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    engine = create_async_engine(db_url)
+    engine = create_async_engine(
+        db_url,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        # SQLAlchemy's prepared statement cache and asyncpg's own; 0 disables both (pgbouncer)
+        connect_args={
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        },
+    )
     AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 else:
     engine = None
@@ -20,3 +79,23 @@ else:
 
 def db_available():
     return engine is not None and AsyncSessionLocal is not None
+
+def get_pool_stats() -> dict:
+    stats = {
+        "checkouts": pool_stats.checkouts,
+        "timeouts": pool_stats.timeouts,
+        "waiting": pool_stats.waiting,
+        "wait_avg_ms": round(pool_stats.wait_total / pool_stats.checkouts * 1000, 3) if pool_stats.checkouts else 0.0,
+        "wait_max_ms": round(pool_stats.wait_max * 1000, 3),
+    }
+
+    if engine is not None:
+        pool = engine.sync_engine.pool
+        stats.update({
+            "size": pool.size(),
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    return stats
+
@@ -1,50 +1,84 @@
+import asyncio
 import logging
 import os
-
-from datetime import datetime, timedelta
-
-from sqlalchemy import inspect, select, text
-
-from db.orm.base import Base
-from db.orm.models import Subscription, SupportAdmin, SupportBan, SupportTicket, SupportTicketMessage, TgSub
-from db.orm.session import AsyncSessionLocal, db_available, engine
+import time
+
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.orm.models import (
+    ScheduleDailyStats,
+    ScheduleSnapshot,
+    Subscription,
+    SupportAdmin,
+    SupportBan,
+    SupportTicket,
+    SupportTicketMessage,
+    TgSub,
+)
+from db.orm.migrations import migrate
+from db.orm.session import AsyncSessionLocal, db_available
 
 log = logging.getLogger(__name__)
 
 PRIMARY_SUPPORT_ADMIN = int(os.getenv("HELP_BASE_ADMIN_ID", "0") or 0)
+SUPPORT_ADMIN_CACHE_TTL = float(os.getenv("SUPPORT_ADMIN_CACHE_TTL", "300"))
+SUBSCRIBER_CHUNK_SIZE = int(os.getenv("SUBSCRIBER_CHUNK_SIZE", "1000"))
 
+# admin ids cached in memory, refilled after TTL or an explicit invalidation
+_support_admin_ids: list[int] | None = None
+_support_admin_set: frozenset[int] = frozenset()
+_support_admin_loaded_at = 0.0
+_support_admin_lock = asyncio.Lock()
+_support_admin_listeners = []
 
-async def init_db():
-    if not db_available():
-        log.info("init_db(): DB not available, skipping migrations.")
+
+@asynccontextmanager
+async def unit_of_work():
+    """
+    One session and one transaction for several calls: pass the yielded
+    session to the functions below, it commits on exit and rolls back on error.
+    Yields None when the DB is disabled, so the calls fall back to their defaults.
+    """
+    if AsyncSessionLocal is None:
+        yield None
         return
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        await conn.run_sync(_ensure_subscription_columns)
-        await conn.run_sync(_ensure_support_tables)
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            yield session
 
 
-def _ensure_subscription_columns(sync_conn):
-    inspector = inspect(sync_conn)
-    columns = {col["name"] for col in inspector.get_columns("subscriptions")}
+@asynccontextmanager
+async def _session_scope(session: AsyncSession | None = None):
+    """Yield (session, owned): the caller's session as is, or a new owned one."""
+    if session is not None:
+        yield session, False
+        return
 
-    if "queue_id" not in columns:
-        sync_conn.execute(text("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS queue_id INTEGER DEFAULT 0"))
+    async with AsyncSessionLocal() as own:
+        yield own, True
 
 
-def _ensure_support_tables(sync_conn):
-    inspector = inspect(sync_conn)
-    tables = set(inspector.get_table_names())
+async def _commit(session: AsyncSession, owned: bool):
+    # a unit of work commits once at the end, its steps only flush
+    if owned:
+        await session.commit()
+    else:
+        await session.flush()
 
-    if "support_admins" not in tables:
-        SupportAdmin.__table__.create(sync_conn, checkfirst=True)
-    if "support_tickets" not in tables:
-        SupportTicket.__table__.create(sync_conn, checkfirst=True)
-    if "support_bans" not in tables:
-        SupportBan.__table__.create(sync_conn, checkfirst=True)
-    if "support_ticket_messages" not in tables:
-        SupportTicketMessage.__table__.create(sync_conn, checkfirst=True)
+
+async def init_db():
+    if not db_available():
+        log.info("init_db(): DB not available, skipping migrations.")
+        return
+
+    version = await migrate()
+    log.info("init_db(): schema at version %s", version)
 
 
 async def ensure_support_admin(tg_id: int, is_primary: bool = False) -> bool:
@@ -64,7 +98,9 @@ async def ensure_support_admin(tg_id: int, is_primary: bool = False) -> bool:
 
         session.add(SupportAdmin(tg_id=tg_id, is_primary=is_primary))
         await session.commit()
-        return True
+
+    await _support_admins_changed()
+    return True
 
 
 async def ensure_primary_support_admin():
@@ -81,10 +117,10 @@ async def ensure_primary_support_admin():
     return False
 
 
-async def get_active_ban(user_id: int) -> SupportBan | None:
+async def get_active_ban(user_id: int, session: AsyncSession | None = None) -> SupportBan | None:
     if AsyncSessionLocal is None:
         return None
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, owned):
         res = await session.execute(select(SupportBan).where(SupportBan.user_id == user_id))
         ban = res.scalar_one_or_none()
         if not ban:
@@ -92,15 +128,20 @@ async def get_active_ban(user_id: int) -> SupportBan | None:
         if ban.until and ban.until < datetime.now(tz=ban.until.tzinfo):
             # ban expired -> cleanup
             await session.delete(ban)
-            await session.commit()
+            await _commit(session, owned)
             return None
         return ban
 
 
-async def set_support_ban(user_id: int, until: datetime | None, reason: str | None) -> bool:
+async def set_support_ban(
+    user_id: int,
+    until: datetime | None,
+    reason: str | None,
+    session: AsyncSession | None = None,
+) -> bool:
     if AsyncSessionLocal is None:
         return False
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, owned):
         try:
             res = await session.execute(select(SupportBan).where(SupportBan.user_id == user_id))
             ban = res.scalar_one_or_none()
@@ -109,33 +150,57 @@ async def set_support_ban(user_id: int, until: datetime | None, reason: str | No
                 ban.reason = reason
             else:
                 session.add(SupportBan(user_id=user_id, until=until, reason=reason))
-            await session.commit()
+            await _commit(session, owned)
             return True
         except Exception:
+            if not owned:
+                raise
             await session.rollback()
             log.exception("Failed to set support ban")
             return False
 
 
-async def remove_support_ban(user_id: int) -> bool:
+async def remove_support_ban(user_id: int, session: AsyncSession | None = None) -> bool:
     if AsyncSessionLocal is None:
         return False
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, owned):
         try:
             res = await session.execute(select(SupportBan).where(SupportBan.user_id == user_id))
             ban = res.scalar_one_or_none()
             if not ban:
                 return False
             await session.delete(ban)
-            await session.commit()
+            await _commit(session, owned)
             return True
         except Exception:
+            if not owned:
+                raise
             await session.rollback()
             log.exception("Failed to remove support ban")
             return False
 
 
-async def list_support_admin_ids() -> list[int]:
+def invalidate_support_admin_cache():
+    global _support_admin_ids
+    _support_admin_ids = None
+
+
+def add_support_admin_listener(callback):
+    """Register an async callback fired after the admin list changes locally."""
+    if callback not in _support_admin_listeners:
+        _support_admin_listeners.append(callback)
+
+
+async def _support_admins_changed():
+    invalidate_support_admin_cache()
+    for callback in _support_admin_listeners:
+        try:
+            await callback()
+        except Exception:
+            log.exception("Support admin listener failed")
+
+
+async def _load_support_admin_ids() -> list[int]:
     if AsyncSessionLocal is None:
         return [PRIMARY_SUPPORT_ADMIN] if PRIMARY_SUPPORT_ADMIN else []
 
@@ -148,11 +213,34 @@ async def list_support_admin_ids() -> list[int]:
         return ids
 
 
+def _support_admin_cache_fresh() -> bool:
+    return (
+        _support_admin_ids is not None
+        and time.monotonic() - _support_admin_loaded_at < SUPPORT_ADMIN_CACHE_TTL
+    )
+
+
+async def list_support_admin_ids() -> list[int]:
+    global _support_admin_ids, _support_admin_set, _support_admin_loaded_at
+
+    if _support_admin_cache_fresh():
+        return list(_support_admin_ids)
+
+    async with _support_admin_lock:
+        if not _support_admin_cache_fresh():
+            ids = await _load_support_admin_ids()
+            _support_admin_ids = ids
+            _support_admin_set = frozenset(ids)
+            _support_admin_loaded_at = time.monotonic()
+        return list(_support_admin_ids)
+
+
 async def is_support_admin(tg_id: int) -> bool:
     if not tg_id:
         return False
-    admins = await list_support_admin_ids()
-    return tg_id in admins
+    if not _support_admin_cache_fresh():
+        await list_support_admin_ids()
+    return tg_id in _support_admin_set
 
 
 async def remove_support_admin(tg_id: int) -> bool:
@@ -170,48 +258,57 @@ async def remove_support_admin(tg_id: int) -> bool:
                 return False
             await session.delete(admin)
             await session.commit()
-            return True
         except Exception:
             await session.rollback()
             log.exception("Failed to remove support admin %s", tg_id)
             return False
 
+    await _support_admins_changed()
+    return True
+
 
 async def is_help_bot_admin(tg_id: int) -> bool:
     """Alias for підтримки-бoта, щоб не плодити зависимости."""
     return await is_support_admin(tg_id)
 
 
-async def create_support_ticket(user_id: int, username: str | None, message: str) -> SupportTicket | None:
+async def create_support_ticket(
+    user_id: int,
+    username: str | None,
+    message: str,
+    session: AsyncSession | None = None,
+) -> SupportTicket | None:
     if AsyncSessionLocal is None:
         log.warning("DB not available, skipping ticket creation")
         return None
 
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, owned):
         try:
             ticket = SupportTicket(user_id=user_id, username=username, message=message, status="open")
             session.add(ticket)
-            await session.commit()
+            await _commit(session, owned)
             await session.refresh(ticket)
             return ticket
         except Exception:
+            if not owned:
+                raise
             await session.rollback()
             log.exception("Failed to create support ticket")
             return None
 
 
-async def get_ticket(ticket_id: int) -> SupportTicket | None:
+async def get_ticket(ticket_id: int, session: AsyncSession | None = None) -> SupportTicket | None:
     if AsyncSessionLocal is None:
         return None
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, _):
         res = await session.execute(select(SupportTicket).where(SupportTicket.id == ticket_id))
         return res.scalar_one_or_none()
 
 
-async def get_last_ticket_time(user_id: int) -> datetime | None:
+async def get_last_ticket_time(user_id: int, session: AsyncSession | None = None) -> datetime | None:
     if AsyncSessionLocal is None:
         return None
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, _):
         res = await session.execute(
             select(SupportTicket.created_at)
             .where(SupportTicket.user_id == user_id)
@@ -222,11 +319,15 @@ async def get_last_ticket_time(user_id: int) -> datetime | None:
         return row[0] if row else None
 
 
-async def can_create_ticket(user_id: int, cooldown_minutes: int = 30) -> tuple[bool, int]:
+async def can_create_ticket(
+    user_id: int,
+    cooldown_minutes: int = 30,
+    session: AsyncSession | None = None,
+) -> tuple[bool, int]:
     """
     Returns (allowed, wait_seconds).
     """
-    last_ts = await get_last_ticket_time(user_id)
+    last_ts = await get_last_ticket_time(user_id, session=session)
     if not last_ts:
         return True, 0
     now = datetime.now(tz=last_ts.tzinfo)
@@ -237,11 +338,16 @@ async def can_create_ticket(user_id: int, cooldown_minutes: int = 30) -> tuple[b
     return False, int(cooldown - delta)
 
 
-async def mark_ticket_answered(ticket_id: int, admin_id: int, answer_text: str) -> bool:
+async def mark_ticket_answered(
+    ticket_id: int,
+    admin_id: int,
+    answer_text: str,
+    session: AsyncSession | None = None,
+) -> bool:
     if AsyncSessionLocal is None:
         return False
 
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, owned):
         try:
             res = await session.execute(select(SupportTicket).where(SupportTicket.id == ticket_id))
             ticket = res.scalar_one_or_none()
@@ -251,69 +357,84 @@ async def mark_ticket_answered(ticket_id: int, admin_id: int, answer_text: str)
             ticket.status = "answered"
             ticket.answer_text = answer_text
             ticket.answered_by = admin_id
-            await session.commit()
+            await _commit(session, owned)
             return True
         except Exception:
+            if not owned:
+                raise
             await session.rollback()
             log.exception("Failed to mark ticket answered")
             return False
 
 
-async def delete_ticket(ticket_id: int) -> bool:
+async def delete_ticket(ticket_id: int, session: AsyncSession | None = None) -> bool:
     if AsyncSessionLocal is None:
         return False
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, owned):
         try:
             res = await session.execute(select(SupportTicket).where(SupportTicket.id == ticket_id))
             ticket = res.scalar_one_or_none()
             if not ticket:
                 return False
             await session.delete(ticket)
-            await session.commit()
+            await _commit(session, owned)
             return True
         except Exception:
+            if not owned:
+                raise
             await session.rollback()
             log.exception("Failed to delete support ticket")
             return False
 
 
-async def save_ticket_message(ticket_id: int, admin_id: int, chat_id: int, message_id: int) -> None:
-    if AsyncSessionLocal is None:
+async def save_ticket_message(
+    ticket_id: int,
+    admin_id: int,
+    chat_id: int,
+    message_id: int,
+    session: AsyncSession | None = None,
+) -> None:
+    await save_ticket_messages(
+        [{"ticket_id": ticket_id, "admin_id": admin_id, "chat_id": chat_id, "message_id": message_id}],
+        session=session,
+    )
+
+
+async def save_ticket_messages(rows: list[dict], session: AsyncSession | None = None) -> None:
+    """Persist several admin message mappings in one INSERT."""
+    if AsyncSessionLocal is None or not rows:
         return
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, owned):
         try:
-            session.add(
-                SupportTicketMessage(
-                    ticket_id=ticket_id,
-                    admin_id=admin_id,
-                    chat_id=chat_id,
-                    message_id=message_id,
-                )
-            )
-            await session.commit()
+            await session.execute(SupportTicketMessage.__table__.insert().values(rows))
+            await _commit(session, owned)
         except Exception:
+            if not owned:
+                raise
             await session.rollback()
-            log.exception("Failed to save ticket message mapping")
+            log.exception("Failed to save ticket message mappings")
 
 
-async def get_ticket_messages(ticket_id: int) -> list[SupportTicketMessage]:
+async def get_ticket_messages(ticket_id: int, session: AsyncSession | None = None) -> list[SupportTicketMessage]:
     if AsyncSessionLocal is None:
         return []
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, _):
         res = await session.execute(select(SupportTicketMessage).where(SupportTicketMessage.ticket_id == ticket_id))
         return list(res.scalars().all())
 
 
-async def delete_ticket_messages(ticket_id: int) -> None:
+async def delete_ticket_messages(ticket_id: int, session: AsyncSession | None = None) -> None:
     if AsyncSessionLocal is None:
         return
-    async with AsyncSessionLocal() as session:
+    async with _session_scope(session) as (session, owned):
         try:
             await session.execute(
                 SupportTicketMessage.__table__.delete().where(SupportTicketMessage.ticket_id == ticket_id)
             )
-            await session.commit()
+            await _commit(session, owned)
         except Exception:
+            if not owned:
+                raise
             await session.rollback()
             log.exception("Failed to delete ticket message mappings")
 
@@ -382,27 +503,70 @@ async def get_all_http_sub():
         log.warning("get_all_http_sub(): DB not available, returning empty list.")
         return []
 
-    async with AsyncSessionLocal() as conn:
-        res = await conn.execute(
+    payload = []
+    async for chunk in iter_http_subs():
+        payload.extend(chunk)
+    return payload
+
+
+async def iter_http_subs(chunk_size: int = SUBSCRIBER_CHUNK_SIZE, queue_ids: list[int] | None = None):
+    """
+    Yield push subscriptions in chunks, paginated by id so every chunk is a
+    short indexed query and memory stays bounded by the chunk size.
+    """
+    if AsyncSessionLocal is None:
+        return
+
+    last_id = 0
+    while True:
+        stmt = (
             select(
+                Subscription.id,
                 Subscription.endpoint,
                 Subscription.p256dh,
                 Subscription.auth,
                 Subscription.queue_id,
             )
+            .where(Subscription.id > last_id)
+            .order_by(Subscription.id)
+            .limit(chunk_size)
         )
+        if queue_ids is not None:
+            stmt = stmt.where(Subscription.queue_id.in_(queue_ids))
+
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(stmt)).all()
+
+        if not rows:
+            return
+
+        last_id = rows[-1][0]
+        yield [
+            {"endpoint": endpoint, "p256dh": p256dh, "auth": auth, "queue": queue_id}
+            for _, endpoint, p256dh, auth, queue_id in rows
+        ]
+
+        if len(rows) < chunk_size:
+            return
+
 
-        rows = res.all()
-        payload = []
-        for endpoint, p256dh, auth, queue_id in rows:
-            payload.append({
-                "endpoint": endpoint,
-                "p256dh": p256dh,
-                "auth": auth,
-                "queue": queue_id,
-            })
+async def subscription_digests() -> dict | None:
+    """
+    {"push"|"telegram": {stored queue_id: (count, hash sum)}}, read from the
+    rows the subscription_digests triggers keep (one per queue).
+    """
+    if AsyncSessionLocal is None:
+        return None
 
-        return payload
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            text("SELECT kind, queue_id, count, total FROM subscription_digests WHERE count <> 0")
+        )).all()
+
+    result = {"push": {}, "telegram": {}}
+    for kind, queue_id, count, total in rows:
+        result[kind][queue_id] = (count, total)
+    return result
 
 
 async def delete_sub(endpoint: str):
@@ -493,6 +657,32 @@ async def get_all_tg_subscribers() -> list[TgSub]:
             return []
 
 
+async def iter_tg_subscribers(chunk_size: int = SUBSCRIBER_CHUNK_SIZE, queue_ids: list[int] | None = None):
+    """Yield Telegram subscribers as {"id", "queue"} chunks, paginated by tg_id."""
+    if AsyncSessionLocal is None:
+        return
+
+    last_id = None
+    while True:
+        stmt = select(TgSub.tg_id, TgSub.queue_id).order_by(TgSub.tg_id).limit(chunk_size)
+        if last_id is not None:
+            stmt = stmt.where(TgSub.tg_id > last_id)
+        if queue_ids is not None:
+            stmt = stmt.where(TgSub.queue_id.in_(queue_ids))
+
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(stmt)).all()
+
+        if not rows:
+            return
+
+        last_id = rows[-1][0]
+        yield [{"id": tg_id, "queue": queue_id} for tg_id, queue_id in rows]
+
+        if len(rows) < chunk_size:
+            return
+
+
 async def delete_tg_subscriber(tg_id: int) -> int:
     if AsyncSessionLocal is None:
         log.warning("db is None")
@@ -551,3 +741,73 @@ async def upsert_tg_subscriber(tg_id: int, queue_id: int) -> int:
             log.exception(f"Error while upserting tg_sub tg_id={tg_id}")
             await session.rollback()
             return 0
+
+
+async def add_schedule_snapshots(rows: list[dict]) -> bool:
+    if AsyncSessionLocal is None or not rows:
+        return False
+
+    async with AsyncSessionLocal() as session:
+        try:
+            await session.execute(ScheduleSnapshot.__table__.insert(), rows)
+            await session.commit()
+            return True
+        except Exception:
+            await session.rollback()
+            log.exception("Failed to archive schedule snapshots")
+            return False
+
+
+async def get_daily_schedules(start: date, end: date, queue_id: int | None = None) -> list[ScheduleSnapshot]:
+    """Latest archived snapshot per queue and day within [start, end]."""
+    if AsyncSessionLocal is None:
+        return []
+
+    stmt = (
+        select(ScheduleSnapshot)
+        .where(ScheduleSnapshot.day >= start, ScheduleSnapshot.day <= end)
+        .distinct(ScheduleSnapshot.queue_id, ScheduleSnapshot.day)
+        .order_by(ScheduleSnapshot.queue_id, ScheduleSnapshot.day, ScheduleSnapshot.id.desc())
+    )
+    if queue_id is not None:
+        stmt = stmt.where(ScheduleSnapshot.queue_id == queue_id)
+
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(stmt)
+        return list(res.scalars().all())
+
+
+async def upsert_daily_stats(rows: list[dict]) -> bool:
+    if AsyncSessionLocal is None or not rows:
+        return False
+
+    stmt = pg_insert(ScheduleDailyStats).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ScheduleDailyStats.queue_id, ScheduleDailyStats.day],
+        set_={
+            "outage_minutes": stmt.excluded.outage_minutes,
+            "longest_outage_minutes": stmt.excluded.longest_outage_minutes,
+            "updated_at": func.now(),
+        },
+    )
+
+    async with AsyncSessionLocal() as session:
+        try:
+            await session.execute(stmt)
+            await session.commit()
+            return True
+        except Exception:
+            await session.rollback()
+            log.exception("Failed to upsert daily schedule stats")
+            return False
+
+
+async def get_daily_stats(start: date, end: date) -> list[ScheduleDailyStats]:
+    if AsyncSessionLocal is None:
+        return []
+
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            select(ScheduleDailyStats).where(ScheduleDailyStats.day >= start, ScheduleDailyStats.day <= end)
+        )
+        return list(res.scalars().all())
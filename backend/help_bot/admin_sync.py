@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+import db.orm.utils as db
+import untils.redis_db as redis_un
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "support_admins:invalidate"
+
+_task: asyncio.Task | None = None
+
+
+async def _publish_change():
+    try:
+        await redis_un.publish(CHANNEL, "1")
+    except Exception:
+        log.exception("Failed to publish support admin change")
+
+
+async def _on_message(_message):
+    db.invalidate_support_admin_cache()
+
+
+def start():
+    """Share admin list invalidations with other workers through Redis pub/sub."""
+    global _task
+
+    if _task is not None or not redis_un.get_redis_client():
+        return
+
+    db.add_support_admin_listener(_publish_change)
+    _task = asyncio.create_task(redis_un.listen(CHANNEL, _on_message))
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
@@ -4,7 +4,10 @@ import os
 from aiogram import Bot, Dispatcher
 
 from db.orm import utils as db
+from help_bot import admin_sync
 from help_bot.handlers import admin, common, tickets
+from untils import tg_session
+from untils import webhook
 
 HELP_BOT_TOKEN = os.getenv("HELP_BOT_TOKEN")
 
@@ -22,15 +25,37 @@ async def start_help_bot():
         logging.info("HELP_BOT_TOKEN is not set; help bot will not start.")
         return
 
-    bot = Bot(HELP_BOT_TOKEN)
+    bot = Bot(HELP_BOT_TOKEN, session=tg_session.make_session())
+    admin_sync.start()
     await db.ensure_primary_support_admin()
 
     dp.include_router(common.router)
     dp.include_router(admin.router)
     dp.include_router(tickets.router)
 
+    if webhook.ENABLED:
+        await webhook.serve("help_bot", bot, dp)
+        return
+
+    # a webhook left by a previous deploy would make getUpdates fail
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 
+async def stop_help_bot():
+    """
+    Stops polling and closes the bot session, used on application shutdown.
+    """
+    try:
+        await dp.stop_polling()
+    except RuntimeError:
+        # polling was never started
+        pass
+
+    await admin_sync.stop()
+    if bot is not None:
+        await bot.session.close()
+
+
 def get_help_bot() -> Bot | None:
     return bot
@@ -7,6 +7,8 @@ from aiogram.filters import Command
 from aiogram.types import Message
 
 import db.orm.utils as db
+from help_bot import limits
+from untils.concurrency import gather_limited
 
 router = Router()
 BASE_ADMIN_ID = int(getenv("HELP_BASE_ADMIN_ID", "0") or 0)
@@ -22,6 +24,16 @@ def _require_admin(func):
   return wrapper
 
 
+async def _delete_admin_messages(message: Message, mappings):
+  async def delete(mapping):
+    await message.bot.delete_message(chat_id=mapping.chat_id, message_id=mapping.message_id)
+
+  results = await gather_limited(delete, mappings, limit=limits.ADMIN_FANOUT_LIMIT)
+  for mapping, result in zip(mappings, results):
+    if isinstance(result, Exception):
+      logging.error("Failed to delete ticket message %s", mapping.message_id, exc_info=result)
+
+
 @router.message(Command("admins"))
 @_require_admin
 async def cmd_admins(message: Message, **_):
@@ -89,6 +101,8 @@ async def cmd_reply(message: Message, **_):
     return
 
   reply_text = parts[2].strip()
+
+  # no transaction is held across the Telegram round-trips below
   ticket = await db.get_ticket(ticket_id)
   if not ticket:
     await message.answer("Заявку не знайдено.")
@@ -104,18 +118,25 @@ async def cmd_reply(message: Message, **_):
     await message.answer("Не вдалося надіслати відповідь користувачу.")
     return
 
-  await db.mark_ticket_answered(ticket_id, message.from_user.id, reply_text)
+  # the user already has the reply, record it and clean up in one transaction
+  try:
+    async with db.unit_of_work() as session:
+      await db.mark_ticket_answered(ticket_id, message.from_user.id, reply_text, session=session)
+      mappings = await db.get_ticket_messages(ticket_id, session=session)
+      await db.delete_ticket_messages(ticket_id, session=session)
+  except Exception:
+    logging.exception("Failed to close support ticket %s after replying", ticket_id)
+    await message.answer(
+      f"Відповідь надіслано користувачу, але заявку #{ticket_id} не вдалося закрити. "
+      "Видаліть її через /del_ticket або спробуйте пізніше."
+    )
+    return
+
   sender = (message.from_user.first_name or "").strip() or "адмін"
   await message.answer(f"Відповідь надіслано користувачу @{ticket.username or 'користувач'} від {sender}.")
 
   # remove admin notifications about this ticket
-  mappings = await db.get_ticket_messages(ticket_id)
-  for m in mappings:
-    try:
-      await message.bot.delete_message(chat_id=m.chat_id, message_id=m.message_id)
-    except Exception:
-      logging.exception("Failed to delete ticket message %s", m.message_id)
-  await db.delete_ticket_messages(ticket_id)
+  await _delete_admin_messages(message, mappings)
 
 
 @router.message(Command("del_ticket"))
@@ -132,19 +153,23 @@ async def cmd_del_ticket(message: Message, **_):
     await message.answer("id має бути числом.")
     return
 
-  ticket = await db.get_ticket(ticket_id)
-  if not ticket:
+  if not await db.get_ticket(ticket_id):
     await message.answer("Заявку не знайдено.")
     return
 
-  if await db.delete_ticket(ticket_id):
-    mappings = await db.get_ticket_messages(ticket_id)
-    for m in mappings:
-      try:
-        await message.bot.delete_message(chat_id=m.chat_id, message_id=m.message_id)
-      except Exception:
-        logging.exception("Failed to delete ticket message %s", m.message_id)
-    await db.delete_ticket_messages(ticket_id)
+  try:
+    async with db.unit_of_work() as session:
+      deleted = await db.delete_ticket(ticket_id, session=session)
+      mappings = []
+      if deleted:
+        mappings = await db.get_ticket_messages(ticket_id, session=session)
+        await db.delete_ticket_messages(ticket_id, session=session)
+  except Exception:
+    logging.exception("Failed to delete support ticket %s", ticket_id)
+    deleted = False
+
+  if deleted:
+    await _delete_admin_messages(message, mappings)
     await message.answer(f"Заявку #{ticket_id} видалено. Вона більше не відображається у адмінів.")
   else:
     await message.answer("Не вдалося видалити заявку. Спробуйте пізніше.")
@@ -170,6 +195,7 @@ async def cmd_ban(message: Message, **_):
 
   ok = await db.set_support_ban(user_id, until, reason)
   if ok:
+    await limits.set_ban(user_id, until, reason)
     await message.answer(f"Користувача {user_id} заблоковано на {minutes} хв. Причина: {reason}")
     try:
       await message.bot.send_message(
@@ -197,6 +223,7 @@ async def cmd_unban(message: Message, **_):
     return
 
   if await db.remove_support_ban(user_id):
+    await limits.clear_ban(user_id)
     await message.answer(f"Бан для {user_id} знято.")
     try:
       await message.bot.send_message(user_id, "Ваш бан знято. Ви можете знову створювати заявки.")
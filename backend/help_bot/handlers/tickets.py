@@ -4,27 +4,36 @@ from aiogram import F, Router
 from aiogram.types import Message
 
 import db.orm.utils as db
+from help_bot import limits
+from untils.concurrency import gather_limited
 
 router = Router()
 
 
 @router.message(F.text)
 async def create_ticket_handler(message: Message):
+  # flood: drop silently, answering would only feed the spam
+  if not limits.allow_message(message.from_user.id):
+    return
+
+  text = (message.text or "").strip()
+  if not text:
+    return
+
   # ban check
-  ban = await db.get_active_ban(message.from_user.id)
+  ban = await limits.get_ban(message.from_user.id)
   if ban:
-    until_str = ban.until.strftime("%d.%m %H:%M") if ban.until else "без дати завершення"
-    await message.answer(f"Ви заблоковані для створення заявок до {until_str}.\nПричина: {ban.reason or 'не вказано'}.")
+    until, reason = ban
+    until_str = until.strftime("%d.%m %H:%M") if until else "без дати завершення"
+    await message.answer(f"Ви заблоковані для створення заявок до {until_str}.\nПричина: {reason or 'не вказано'}.")
     return
 
-  allowed, wait_seconds = await db.can_create_ticket(message.from_user.id, cooldown_minutes=30)
-  if not allowed:
+  wait_seconds = await limits.cooldown_remaining(message.from_user.id)
+  if wait_seconds:
     mins = (wait_seconds + 59) // 60
-    await message.answer(f"Можна створювати лише одну заявку кожні 30 хв. Спробуйте через ~{mins} хв.")
-    return
-
-  text = (message.text or "").strip()
-  if not text:
+    await message.answer(
+      f"Можна створювати лише одну заявку кожні {limits.TICKET_COOLDOWN_MINUTES} хв. Спробуйте через ~{mins} хв."
+    )
     return
 
   ticket = await db.create_support_ticket(
@@ -37,23 +46,31 @@ async def create_ticket_handler(message: Message):
     await message.answer("Не вдалося створити заявку. Спробуйте пізніше.")
     return
 
+  await limits.note_ticket(message.from_user.id)
+
   await message.answer(f"Створили заявку #{ticket.id}. Ми надішлемо відповідь тут.")
 
   admins = await db.list_support_admin_ids()
   if not admins:
     return
 
-  for admin_id in admins:
-    try:
-      sent = await message.bot.send_message(
-        admin_id,
-        (
-          f"Нова заявка #{ticket.id}\n"
-          f"Від: @{message.from_user.username or 'користувач'} (id {message.from_user.id})\n\n"
-          f"{text}\n\n"
-          f"Відповісти: /reply {ticket.id} <текст>"
-        ),
-      )
-      await db.save_ticket_message(ticket.id, admin_id, admin_id, sent.message_id)
-    except Exception:  # pragma: no cover - network
-      logging.exception("Failed to notify admin about ticket")
+  admin_text = (
+    f"Нова заявка #{ticket.id}\n"
+    f"Від: @{message.from_user.username or 'користувач'} (id {message.from_user.id})\n\n"
+    f"{text}\n\n"
+    f"Відповісти: /reply {ticket.id} <текст>"
+  )
+
+  async def notify_admin(admin_id: int):
+    sent = await message.bot.send_message(admin_id, admin_text)
+    return {"ticket_id": ticket.id, "admin_id": admin_id, "chat_id": admin_id, "message_id": sent.message_id}
+
+  results = await gather_limited(notify_admin, admins, limit=limits.ADMIN_FANOUT_LIMIT)
+
+  mappings = []
+  for result in results:
+    if isinstance(result, Exception):  # pragma: no cover - network
+      logging.error("Failed to notify admin about ticket", exc_info=result)
+    else:
+      mappings.append(result)
+  await db.save_ticket_messages(mappings)
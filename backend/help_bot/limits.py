@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import db.orm.utils as db
+import untils.redis_db as redis_un
+
+log = logging.getLogger(__name__)
+
+TICKET_COOLDOWN_MINUTES = 30
+MESSAGE_BURST = int(os.getenv("SUPPORT_MESSAGE_BURST", "5"))
+MESSAGE_RATE_PER_MINUTE = float(os.getenv("SUPPORT_MESSAGE_RATE", "5"))
+CACHE_TTL = float(os.getenv("SUPPORT_LIMITS_CACHE_TTL", "60"))
+# parallel Telegram calls when notifying or cleaning up after admins
+ADMIN_FANOUT_LIMIT = int(os.getenv("SUPPORT_ADMIN_FANOUT_LIMIT", "10"))
+_MAX_ENTRIES = 10_000
+
+# user_id -> (tokens, last refill on the monotonic clock)
+_buckets: dict[int, tuple[float, float]] = {}
+# user_id -> (last ticket epoch or 0, cached at)
+_last_ticket: dict[int, tuple[float, float]] = {}
+# user_id -> ((until epoch or None, reason) or None when not banned, cached at)
+_bans: dict[int, tuple[tuple[float | None, str | None] | None, float]] = {}
+
+
+def _trim(cache: dict):
+    if len(cache) > _MAX_ENTRIES:
+        for key in list(cache)[: len(cache) - _MAX_ENTRIES]:
+            del cache[key]
+
+
+def allow_message(user_id: int) -> bool:
+    """Token bucket per user, so flooding is rejected before any I/O."""
+    now = time.monotonic()
+    tokens, updated = _buckets.get(user_id, (MESSAGE_BURST, now))
+    tokens = min(MESSAGE_BURST, tokens + (now - updated) * MESSAGE_RATE_PER_MINUTE / 60)
+
+    allowed = tokens >= 1
+    _buckets[user_id] = (tokens - 1 if allowed else tokens, now)
+    _trim(_buckets)
+    return allowed
+
+
+def _ban_key(user_id: int) -> str:
+    return f"support:ban:{user_id}"
+
+
+def _ticket_key(user_id: int) -> str:
+    return f"support:last_ticket:{user_id}"
+
+
+async def _load_ban(user_id: int):
+    try:
+        raw = await redis_un.get_value(_ban_key(user_id))
+    except Exception as exc:
+        log.warning("Redis ban lookup failed: %s", exc)
+        raw = None
+
+    if raw is not None:
+        data = json.loads(raw)
+        return (data["until"], data["reason"]) if data else None
+
+    ban = await db.get_active_ban(user_id)
+    entry = (ban.until.timestamp() if ban.until else None, ban.reason) if ban else None
+    await _share_ban(user_id, entry)
+    return entry
+
+
+async def _share_ban(user_id: int, entry):
+    payload = json.dumps({"until": entry[0], "reason": entry[1]} if entry else None)
+    ttl = None
+    if entry and entry[0]:
+        ttl = max(1, int(entry[0] - time.time()))
+    elif not entry:
+        ttl = int(CACHE_TTL)
+
+    try:
+        await redis_un.set_value(_ban_key(user_id), payload, ttl)
+    except Exception as exc:
+        log.warning("Redis ban store failed: %s", exc)
+
+
+async def get_ban(user_id: int) -> tuple[datetime | None, str | None] | None:
+    """Active ban as (until, reason), the database is read only on a cache miss."""
+    now = time.monotonic()
+    cached = _bans.get(user_id)
+    if cached is None or now - cached[1] >= CACHE_TTL:
+        cached = (await _load_ban(user_id), now)
+        _bans[user_id] = cached
+        _trim(_bans)
+
+    entry = cached[0]
+    if not entry:
+        return None
+
+    until, reason = entry
+    if until is not None and until <= time.time():
+        _bans[user_id] = (None, now)
+        return None
+    return (datetime.fromtimestamp(until).astimezone() if until else None, reason)
+
+
+async def set_ban(user_id: int, until: datetime | None, reason: str | None):
+    entry = (until.timestamp() if until else None, reason)
+    _bans[user_id] = (entry, time.monotonic())
+    await _share_ban(user_id, entry)
+
+
+async def clear_ban(user_id: int):
+    _bans[user_id] = (None, time.monotonic())
+    await _share_ban(user_id, None)
+
+
+async def _load_last_ticket(user_id: int) -> float:
+    try:
+        raw = await redis_un.get_value(_ticket_key(user_id))
+    except Exception as exc:
+        log.warning("Redis cooldown lookup failed: %s", exc)
+        raw = None
+
+    if raw is not None:
+        return float(raw)
+
+    last_ts = await db.get_last_ticket_time(user_id)
+    return last_ts.timestamp() if last_ts else 0.0
+
+
+async def cooldown_remaining(user_id: int) -> int:
+    """Seconds until the user may open another ticket."""
+    now = time.monotonic()
+    cached = _last_ticket.get(user_id)
+    if cached is None or now - cached[1] >= CACHE_TTL:
+        cached = (await _load_last_ticket(user_id), now)
+        _last_ticket[user_id] = cached
+        _trim(_last_ticket)
+
+    if not cached[0]:
+        return 0
+    remaining = cached[0] + TICKET_COOLDOWN_MINUTES * 60 - time.time()
+    return max(0, int(remaining))
+
+
+async def note_ticket(user_id: int):
+    created = time.time()
+    _last_ticket[user_id] = (created, time.monotonic())
+    try:
+        await redis_un.set_value(_ticket_key(user_id), str(created), TICKET_COOLDOWN_MINUTES * 60)
+    except Exception as exc:
+        log.warning("Redis cooldown store failed: %s", exc)
@@ -1,29 +1,42 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
 from typing import Any
 
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 
 load_dotenv()
 
-import bot.bot as bot
-import help_bot.bot as help_bot
 import untils.redis_db as redis_un
 from untils import notifier
 from untils import subcription
 from untils import cache
-import db.orm.utils as db
+from untils import leader
+from untils import archive
+from untils import stats
+from untils import readiness
+from untils import metrics
+from untils import loopmon
+from untils import tracing
+from untils import webhook
+from untils import renders
+from untils import notify_jobs
+from untils import reconcile
+from untils.lazy import lazy_import
 
 import asyncio
+import json
+import time
 
 import logging as log
 
-from proto import status_pb2
+# optional subsystems load on first use, so a worker only pays for what its config enables
+bot = lazy_import("bot.bot")
+help_bot = lazy_import("help_bot.bot")
+db = lazy_import("db.orm.utils")
+status_pb2 = lazy_import("proto.status_pb2")
 
 log.basicConfig(
     level=log.INFO,
@@ -45,16 +58,43 @@ app.add_middleware(
 )
 
 BASE_PATH = "/api"
-ISDB = True
+
+
+@app.middleware("http")
+async def observe_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template, raw paths would explode the series count
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status,
+        )
 
 NOTIFY_PASS = os.getenv("NOTIFY_PASS")
 
 BOT_ONLINE = os.getenv("BOT_ONLINE") == "true"
-HELP_BOT_TOKEN = help_bot.HELP_BOT_TOKEN
+HELP_BOT_TOKEN = os.getenv("HELP_BOT_TOKEN")
 OFFLINE = os.getenv("OFFLINE", "false").lower() == "true"
+ISDB = not OFFLINE
 
 VAPID_PUBLIC_KEY = os.getenv("VAPID_PUBLIC_KEY")
 VAPID_PRIVATE_KEY = os.getenv("VAPID_PRIVATE_KEY")
+WARMUP_ATTEMPTS = int(os.getenv("WARMUP_ATTEMPTS", "3"))
+WARMUP_MAX_DELAY = 60
+# serve after WARMUP_ATTEMPTS failed warmups instead of waiting for the caches
+READY_WHEN_COLD = os.getenv("READY_WHEN_COLD", "false").lower() == "true"
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+
+_background_tasks: set[asyncio.Task] = set()
+_scheduler = None
 
 @app.get(f"{BASE_PATH}/vapid_public_key")
 def vapid_key():
@@ -96,7 +136,7 @@ async def subscribe(req: Request):
 
     await subcription.save_subscription_db(queue, sub_push)
 
-    await subcription.save_all_to_redis()
+    await subcription.save_push_to_redis(sub_push)
 
     return {"ok": True, "msg": "Ви пiдписались на сповiщення" if created else "Данi пiдписки оновлено"}
 
@@ -118,7 +158,7 @@ async def unsubscribe(req: Request):
         except Exception as ex:
             log.warning(f"delete_sub failed: {ex}")
 
-    await subcription.save_all_to_redis()
+    await subcription.delete_push_from_redis(endpoint)
     return {"ok": True, "msg": "Підписку скасовано" if removed else "Підписка не знайдена"}
 
 
@@ -133,6 +173,142 @@ async def notify(req: Request):
 
     return await notifier.notify_all(title=title, message=message)
 
+
+def _notify_authorized(req: Request, body: dict | None = None) -> bool:
+    given = req.headers.get("X-Notify-Pass") or (body or {}).get("pass")
+    return bool(NOTIFY_PASS) and given == NOTIFY_PASS
+
+
+@app.post(f"{BASE_PATH}/notify/jobs")
+async def notify_job_submit(req: Request):
+    body: dict[str, Any] = await req.json()
+    if not _notify_authorized(req, body):
+        return JSONResponse({"msg": "incorrect password"}, status_code=403)
+
+    title = body.get("title")
+    message = body.get("message")
+    queues = body.get("queues")
+    if not title or not message:
+        return JSONResponse({"msg": "title and message are required"}, status_code=400)
+    if queues is not None and not isinstance(queues, list):
+        return JSONResponse({"msg": "queues must be a list"}, status_code=400)
+
+    try:
+        job = await notify_jobs.submit(title, message, queues)
+    except ValueError as exc:
+        return JSONResponse({"msg": str(exc)}, status_code=400)
+    return JSONResponse(job, status_code=202)
+
+
+@app.get(f"{BASE_PATH}/notify/jobs/{{job_id}}")
+async def notify_job_status(job_id: str, req: Request):
+    if not _notify_authorized(req):
+        return JSONResponse({"msg": "incorrect password"}, status_code=403)
+
+    job = await notify_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"msg": "job not found"}, status_code=404)
+    return job
+
+
+@app.post(f"{BASE_PATH}/notify/jobs/{{job_id}}/resume")
+async def notify_job_resume(job_id: str, req: Request):
+    if not _notify_authorized(req):
+        return JSONResponse({"msg": "incorrect password"}, status_code=403)
+
+    try:
+        job = await notify_jobs.resume(job_id)
+    except ValueError as exc:
+        return JSONResponse({"msg": str(exc)}, status_code=409)
+    if job is None:
+        return JSONResponse({"msg": "job not found"}, status_code=404)
+    return JSONResponse(job, status_code=202)
+
+
+@app.get(f"{BASE_PATH}/notify/jobs/{{job_id}}/events")
+async def notify_job_events(job_id: str, req: Request):
+    """NDJSON: one line per progress change, the last one has the final result."""
+    if not _notify_authorized(req):
+        return JSONResponse({"msg": "incorrect password"}, status_code=403)
+    if await notify_jobs.get(job_id) is None:
+        return JSONResponse({"msg": "job not found"}, status_code=404)
+
+    async def lines():
+        async for job in notify_jobs.watch(job_id):
+            yield json.dumps(job, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post(f"{BASE_PATH}/admin/profile")
+async def admin_profile(req: Request):
+    from untils import profiler
+
+    if not profiler.PROFILING_ENABLED:
+        return JSONResponse({"msg": "profiling is disabled"}, status_code=404)
+
+    body: dict[str, Any] = await req.json()
+    if not NOTIFY_PASS or NOTIFY_PASS != body.get("pass"):
+        return JSONResponse({"msg": "incorrect password"}, status_code=403)
+
+    try:
+        seconds = float(body.get("seconds", 10))
+    except (TypeError, ValueError):
+        return JSONResponse({"msg": "seconds must be a number"}, status_code=400)
+
+    try:
+        archive = await profiler.capture(seconds)
+    except profiler.ProfilerBusy:
+        return JSONResponse({"msg": "a profile is already running"}, status_code=409)
+
+    filename = f"profile-{os.getpid()}-{int(time.time())}.zip"
+    return Response(
+        archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.post(f"{BASE_PATH}/tg/{{name}}/webhook")
+async def telegram_webhook(name: str, req: Request):
+    return await webhook.handle(name, req)
+
+@app.get(f"{BASE_PATH}/sources")
+def sources_health():
+    from untils import sources
+
+    snapshot = cache.get_snapshot()
+    return {
+        "sources": sources.health(),
+        "origins": {subcription.queue_label(queue): origin for queue, origin in snapshot.origins.items()} if snapshot else {},
+    }
+
+@app.get(f"{BASE_PATH}/metrics/db")
+def db_pool_metrics():
+    if not ISDB:
+        return {}
+    from db.orm.session import get_pool_stats
+    return get_pool_stats()
+
+metrics.Gauge(
+    "svitlo_db_pool",
+    "Connection pool state and checkout counters, see /api/metrics/db.",
+    ("stat",),
+    func=lambda: {(name,): value for name, value in db_pool_metrics().items()},
+)
+
+@app.get(f"{BASE_PATH}/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get(f"{BASE_PATH}/stats")
+async def get_stats(req: Request):
+    payload = stats.get_stats()
+    etag = f'"{payload["version"]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+
+    if req.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
 @app.get(f"{BASE_PATH}/status")
 async def get_status(queue: str | None = None):
     queue_code = subcription.queue_code_from_input(queue)
@@ -189,37 +365,198 @@ async def grpc_get_status(req: Request):
         },
     )
 
+@app.get(f"{BASE_PATH}/healthz")
+def healthz():
+    return {"ok": True}
+
+@app.get(f"{BASE_PATH}/readyz")
+def readyz():
+    state = readiness.status()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+async def _init_db_step():
+    global ISDB
+
+    if OFFLINE:
+        log.info("db disabled, offline mode")
+        subcription.set_db_enabled(False)
+        return
+
+    try:
+        await db.init_db()
+    except Exception as exc:
+        log.warning(f"init_db() failed: {exc}")
+        db.disable_db()
+        ISDB = False
+        subcription.set_db_enabled(False)
+        return
+
+    cache.add_listener(archive.record_snapshot)
+    try:
+        await stats.load()
+    except Exception as exc:
+        log.warning(f"stats.load() failed: {exc}")
+
+
+async def _init_redis_step():
+    redis_client = await redis_un.init_redis()
+    subcription.set_redis_client(redis_client)
+
+    # only one worker runs the periodic jobs, the rest follow its results
+    await leader.elect()
+    leader.start()
+
+
+async def _warm(step: str, func, is_warm=None):
+    """Retry `func` until it leaves `step` warm; a cache listener may finish it first."""
+    attempt = 0
+    while not readiness.is_done(step):
+        attempt += 1
+        try:
+            await func()
+            if is_warm is None or is_warm():
+                readiness.done(step)
+                return
+            log.warning(f"{step} warmup got no data (attempt {attempt})")
+        except Exception as exc:
+            log.warning(f"{step} warmup failed (attempt {attempt}): {exc}")
+
+        if attempt == WARMUP_ATTEMPTS:
+            if READY_WHEN_COLD:
+                log.warning(f"{step} is still cold, marking it ready (READY_WHEN_COLD)")
+                readiness.done(step)
+                return
+            log.warning(f"{step} is still cold, /api/readyz stays 503 until it warms up")
+        await asyncio.sleep(min(attempt * 2, WARMUP_MAX_DELAY))
+
+
+async def _schedule_ready(by_queue, scraped):
+    # the cron refresh may warm the cache before the warmup retry does
+    if cache.is_warm():
+        readiness.done("schedule_cache")
+
+
+async def _warmup():
+    await asyncio.gather(
+        _warm("subscriptions", subcription.load_subscriptions_from_storage),
+        _warm("schedule_cache", cache.refresh, cache.is_warm),
+    )
+
+
+def _spawn(coro):
+    # keep a reference, the loop only holds weak ones
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
 @app.on_event("startup")
 async def start():
-    scheduler = AsyncIOScheduler()
+    global _scheduler
+
+    readiness.require("subscriptions", "schedule_cache")
+    loopmon.start()
+    tracing.start()
+
+    # DB migrations and Redis/leader election do not depend on each other
+    await asyncio.gather(_init_db_step(), _init_redis_step())
+    cache.add_listener(stats.record_snapshot)
+    cache.add_listener(_schedule_ready)
+    if BOT_ONLINE:
+        # /status answers are rendered per refresh, not per command
+        cache.add_listener(renders.record_snapshot)
+
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+    _scheduler = AsyncIOScheduler()
     if not OFFLINE:
-        scheduler.add_job(notifier.check_and_notify, "cron", minute="*/30")
+        _scheduler.add_job(leader.only_leader(notifier.check_and_notify), "cron", minute="*/30")
     else:
         log.info("app started in offline mode")
 
-    scheduler.add_job(cache.cache_loop, "cron", minute="*/5")
-    scheduler.start()
+    _scheduler.add_job(cache.refresh, "cron", minute="*/5")
+    _scheduler.start()
 
     log.info("scheduler started")
 
-    if not OFFLINE:
-        try:
-            await db.init_db()
-        except Exception as exc:
-            log.warning(f"init_db() failed: {exc}")
-            db.disable_db()
-            global ISDB
-            ISDB = False
-    else:
-        log.info("db disabled, offline mode")
-    
     if BOT_ONLINE:
-        asyncio.create_task(bot.start_bot())
+        _spawn(bot.start_bot())
 
     if HELP_BOT_TOKEN:
-        asyncio.create_task(help_bot.start_help_bot())
+        _spawn(help_bot.start_help_bot())
     else:
         log.info("help bot is disabled (no HELP_BOT_TOKEN)")
-    redis_client = await redis_un.init_redis()
-    subcription.set_redis_client(redis_client)
-    await subcription.load_subscriptions_from_storage()
+
+    # manual broadcasts queued through /api/notify/jobs
+    _spawn(notify_jobs.run_worker())
+
+    if reconcile.RECONCILE_INTERVAL > 0:
+        _spawn(reconcile.run())
+
+    # /api/healthz answers right away, /api/readyz waits for the warm caches
+    _spawn(_warmup())
+
+
+async def _shutdown_step(name: str, coro, deadline: float):
+    remaining = deadline - asyncio.get_running_loop().time()
+    try:
+        await asyncio.wait_for(coro, timeout=max(0.1, remaining))
+    except asyncio.TimeoutError:
+        log.warning("shutdown step %s timed out", name)
+    except Exception:
+        log.exception("shutdown step %s failed", name)
+
+
+@app.on_event("shutdown")
+async def stop():
+    """
+    Stop taking new work, let running broadcasts finish within SHUTDOWN_TIMEOUT,
+    then close the pools.
+    """
+    deadline = asyncio.get_running_loop().time() + SHUTDOWN_TIMEOUT
+    readiness.set_draining()
+
+    if _scheduler is not None:
+        # running jobs are tasks on this loop, they are drained below
+        _scheduler.shutdown(wait=False)
+    # a pending source retry would scrape again behind the scheduler's back
+    from untils import sources
+
+    await sources.stop_retries()
+
+    # another worker can take over the reminders right away
+    await _shutdown_step("leader", leader.stop(), deadline)
+
+    # queued webhook updates still need the bot sessions
+    await _shutdown_step("webhook", webhook.stop(), deadline)
+    if BOT_ONLINE:
+        await _shutdown_step("bot", bot.stop_bot(), deadline)
+    if HELP_BOT_TOKEN:
+        await _shutdown_step("help bot", help_bot.stop_help_bot(), deadline)
+
+    cancelled = await notifier.drain(deadline - asyncio.get_running_loop().time())
+    if cancelled:
+        log.warning("%s broadcasts did not finish before shutdown", cancelled)
+
+    # no subscription flush here: every write path already stored its single
+    # item in Redis, and a full save from this worker's memory would overwrite
+    # what other workers added since
+
+    for task in list(_background_tasks):
+        task.cancel()
+    if _background_tasks:
+        await asyncio.wait(_background_tasks, timeout=2)
+
+    await _shutdown_step("redis", redis_un.close_redis(), deadline)
+    await loopmon.stop()
+    await tracing.stop()
+
+    if ISDB:
+        from db.orm import session as db_session
+
+        if db_session.engine is not None:
+            await _shutdown_step("db", db_session.engine.dispose(), deadline)
+
+    log.info("shutdown complete")
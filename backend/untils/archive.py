@@ -0,0 +1,70 @@
+import logging
+from datetime import date
+
+from untils.lazy import lazy_import
+
+db = lazy_import("db.orm.utils")
+
+log = logging.getLogger(__name__)
+
+# (slots, mask) of the last archived snapshot per queue for _archive_day
+_last_masks: dict[int, tuple[int, int]] = {}
+_archive_day: date | None = None
+
+
+def pack_status(status: list[int]) -> int:
+    mask = 0
+    for idx, value in enumerate(status):
+        if value:
+            mask |= 1 << idx
+    return mask
+
+
+def unpack_status(mask: int, slots: int) -> list[int]:
+    return [(mask >> idx) & 1 for idx in range(slots)]
+
+
+def outage_hours(mask: int, slots: int) -> float:
+    if not slots:
+        return 0.0
+    return bin(mask).count("1") * 24 / slots
+
+
+async def _load_last_masks(day: date):
+    global _last_masks, _archive_day
+
+    rows = await db.get_daily_schedules(day, day)
+    _last_masks = {row.queue_id: (row.slots, row.mask) for row in rows}
+    _archive_day = day
+
+
+async def record_snapshot(statuses: dict[int, list[int] | None], scraped: bool = True) -> list[dict]:
+    """
+    Cache listener: archive the queues whose schedule changed since the last
+    refresh. Only the worker that scraped writes, followers see the same data.
+    """
+    if not scraped:
+        return []
+
+    today = date.today()
+    if _archive_day != today:
+        await _load_last_masks(today)
+
+    rows = []
+    for queue_id, status in statuses.items():
+        if not status:
+            continue
+
+        packed = (len(status), pack_status(status))
+        if _last_masks.get(queue_id) == packed:
+            continue
+
+        rows.append({"queue_id": queue_id, "day": today, "slots": packed[0], "mask": packed[1]})
+
+    if rows and await db.add_schedule_snapshots(rows):
+        for row in rows:
+            _last_masks[row["queue_id"]] = (row["slots"], row["mask"])
+        log.info("archived schedule changes for %s queues", len(rows))
+        return rows
+
+    return []
@@ -1,39 +1,101 @@
 from untils.variebles import QUEUE_LABELS
-import untils.tools as tools
+import untils.redis_db as redis_un
+from untils import sources
+from untils import leader
+from untils import metrics
+from untils import tracing
 
 import logging
+import time
 
 log = logging.getLogger(__name__)
 
-_cache_queue = []
+# merged result of the schedule sources, _status_cache is its slots in QUEUE_LABELS order
+_snapshot: sources.Snapshot | None = None
+_status_cache = []
 
-_all_index = []
-_all_bias = []
+# async callbacks(statuses_by_queue, scraped) run after every cache update
+_listeners = []
+# wall clock of the last update, for the cache age gauge
+_updated_at: float | None = None
+# (trace id, span id) of the last update, notification spans link to it
+_snapshot_context: tuple[str, str] | None = None
 
-for index in QUEUE_LABELS:
-    _all_index.append(tools.queue_to_index(index))
-for index in _all_index:
-    _all_bias.append(tools.bias_from_index(index))
+def add_listener(callback):
+    if callback not in _listeners:
+        _listeners.append(callback)
 
+def snapshot_by_queue() -> dict[int, list[int] | None]:
+    return dict(zip(QUEUE_LABELS, _status_cache))
+
+def is_warm() -> bool:
+    """True once some queue has a schedule, a failed scrape leaves every slot None."""
+    return any(status for status in _status_cache)
+
+def cache_age() -> float | None:
+    if _updated_at is None:
+        return None
+    return time.time() - _updated_at
+
+metrics.Gauge("svitlo_schedule_cache_age_seconds", "Seconds since the schedule cache was updated.", func=cache_age)
+
+def snapshot_context() -> tuple[str, str] | None:
+    return _snapshot_context
+
+@tracing.traced("cache.update")
+async def _set_cache(snapshot: sources.Snapshot, scraped: bool):
+    global _snapshot, _status_cache, _updated_at, _snapshot_context
+    tracing.current_span().set(scraped=scraped)
+    _snapshot_context = tracing.current_context()
+    _snapshot = snapshot
+    _status_cache = [snapshot.statuses.get(queue) for queue in QUEUE_LABELS]
+    _updated_at = time.time()
+    metrics.CACHE_REFRESHES.inc(source="scrape" if scraped else "shared")
+
+    by_queue = snapshot_by_queue()
+    for callback in _listeners:
+        try:
+            await callback(by_queue, scraped)
+        except Exception as exc:
+            log.warning("cache listener %s failed: %s", getattr(callback, "__name__", callback), exc)
+
+@tracing.traced("cache.scrape")
 async def cache_loop():
-    new_cache = []
-    for queue, bias in zip(_all_index, _all_bias):
-        new_cache.append(await tools.get_status(queue, bias))
-        
-    global _cache_queue
-    _cache_queue = new_cache
-    log.debug(f"\n\tall_index: {_all_index}\n\tall_bias: {_all_bias}\n\tcache: {_cache_queue}\n\t")
-
-async def get_cache(queue):
-    if not _cache_queue:
-        await cache_loop()
-    
-    log.debug(f"{_cache_queue}")
+    snapshot = await sources.collect()
+    await _set_cache(snapshot, scraped=True)
+    log.debug(f"\n\torigins: {snapshot.origins}\n\tcache: {_status_cache}\n\t")
 
-    return _cache_queue[queue-1]
+    try:
+        await redis_un.save_schedule_cache(snapshot.to_dict())
+    except Exception as exc:
+        log.warning("failed to share schedule cache in Redis: %s", exc)
 
-async def get_all_cache():
-    if not _cache_queue:
+# a failing source that recovers between two refresh jobs is published right away
+sources.set_retry_callback(cache_loop)
+
+async def load_shared_cache() -> bool:
+    try:
+        shared = await redis_un.load_schedule_cache()
+    except Exception as exc:
+        log.warning("failed to load schedule cache from Redis: %s", exc)
+        return False
+
+    if not shared:
+        return False
+
+    await _set_cache(sources.Snapshot.from_dict(shared), scraped=False)
+    return True
+
+async def refresh():
+    """Scheduler job: the leader scrapes, followers pick up its result."""
+    if leader.is_leader() or not await load_shared_cache():
         await cache_loop()
-    
-    return _cache_queue
+
+async def get_status_cache(queue):
+    if not _status_cache:
+        await refresh()
+
+    return _status_cache[queue-1]
+
+def get_snapshot() -> sources.Snapshot | None:
+    return _snapshot
@@ -0,0 +1,20 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable
+
+
+async def gather_limited(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Iterable[Any],
+    limit: int = 10,
+) -> list[Any]:
+    """
+    Run `func(item)` for every item with at most `limit` calls in flight.
+    Results keep the input order; failures are returned as exceptions.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def _run(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(_run(item) for item in items), return_exceptions=True)
@@ -1,15 +1,17 @@
 import untils.subcription as sub
 import untils.redis_db as redis_db
-import db.orm.utils as db
+from untils.lazy import lazy_import
 
-async def delete_tg_sub(id: int):
-    subAnsw = sub.forget_telegram_subscription(id)
+db = lazy_import("db.orm.utils")
+
+async def delete_tg_sub(id: int, queue: int | None = None):
+    subAnsw = sub.forget_telegram_subscription(id, queue)
     redisAnsw = await redis_db.delete_tg_subscription(id)
-    dbAnsw = await db.delete_tg_subscriber(id)
+    dbAnsw = await db.delete_tg_subscriber(id) if sub.db_enabled() else 0
     return subAnsw, redisAnsw, dbAnsw
 
-async def delete_web_sub(endpoint):
-    subAnsw = sub.forget_push_subscription(endpoint)
+async def delete_web_sub(endpoint, queue: int | None = None):
+    subAnsw = sub.forget_push_subscription(endpoint, queue)
     redisAnsw = await redis_db.delete_push_subscription(endpoint)
-    dbAnsw = await db.delete_sub(endpoint)
+    dbAnsw = await db.delete_sub(endpoint) if sub.db_enabled() else False
     return subAnsw, redisAnsw, dbAnsw
\ No newline at end of file
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from functools import wraps
+
+import untils.redis_db as redis_un
+
+log = logging.getLogger(__name__)
+
+LEADER_KEY = "scheduler:leader"
+LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+RENEW_INTERVAL = LEASE_SECONDS / 3
+
+_token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_is_leader = False
+# monotonic time our lease in Redis runs out if it is not renewed
+_lease_until = 0.0
+_task: asyncio.Task | None = None
+
+
+def is_leader() -> bool:
+    return _is_leader
+
+
+async def elect() -> bool:
+    """
+    Try to take or renew the lease. Without Redis this worker is the only
+    one that can coordinate, so it always leads.
+
+    When the lease can not be checked (a Redis blip) every worker keeps its
+    role: the leader until its lease would have expired, since nobody else
+    can take the key before that. Past it the leader steps down on purpose,
+    once Redis is back another worker may already hold the key, and two
+    leaders would double reminders and scrapes.
+    """
+    global _is_leader, _lease_until
+
+    started = time.monotonic()
+    try:
+        acquired = await redis_un.acquire_lock(LEADER_KEY, _token, int(LEASE_SECONDS * 1000))
+    except Exception as exc:
+        acquired = _is_leader and time.monotonic() < _lease_until
+        log.warning("leader election failed, %s: %s", "keeping the lease" if acquired else "not leading", exc)
+    else:
+        if acquired:
+            # measured from before the call, the lease may have started any time after it
+            _lease_until = started + LEASE_SECONDS
+
+    if acquired is None:
+        acquired = True
+
+    if acquired != _is_leader:
+        log.info("worker %s %s scheduler leadership", _token, "took" if acquired else "lost")
+    _is_leader = acquired
+    return _is_leader
+
+
+async def _renew_loop():
+    while True:
+        await elect()
+        await asyncio.sleep(RENEW_INTERVAL)
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_renew_loop())
+
+
+async def stop():
+    global _task, _is_leader, _lease_until
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+    if _is_leader:
+        try:
+            await redis_un.release_lock(LEADER_KEY, _token)
+        except Exception as exc:
+            log.warning("failed to release leader lock: %s", exc)
+    _is_leader = False
+    _lease_until = 0.0
+
+
+def only_leader(func):
+    """Scheduler job wrapper: followers skip the run."""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not _is_leader:
+            return None
+        return await func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,123 @@
+"""
+Event loop lag sampler and blocked-loop watchdog.
+
+A task on the loop ticks every LOOP_LAG_INTERVAL seconds and records how late
+it woke up. A daemon thread watches the tick; when the loop has not ticked for
+longer than SLOW_CALLBACK_SECONDS it grabs the loop thread's stack and the
+running task, so whatever blocks the loop shows up in the log and in metrics.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from untils import metrics
+
+log = logging.getLogger(__name__)
+
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "true").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+SLOW_CALLBACK_SECONDS = float(os.getenv("SLOW_CALLBACK_SECONDS", "0.25"))
+
+LOOP_LAG_SECONDS = metrics.Histogram(
+    "svitlo_event_loop_lag_seconds",
+    "How late the loop lag sampler woke up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = metrics.Counter(
+    "svitlo_event_loop_blocked_total", "Times the loop was blocked longer than the threshold.", ("task",)
+)
+
+# latest blocking reports, newest last
+recent_blocks: deque[dict] = deque(maxlen=20)
+
+_task: asyncio.Task | None = None
+_watchdog: threading.Thread | None = None
+_stop = threading.Event()
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_thread_id: int | None = None
+# monotonic time of the last sampler tick, written on the loop and read by the watchdog
+_heartbeat = 0.0
+
+
+async def _sample():
+    global _heartbeat
+
+    while True:
+        expected = time.monotonic() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        now = time.monotonic()
+        _heartbeat = now
+
+        lag = max(0.0, now - expected)
+        LOOP_LAG_SECONDS.observe(lag)
+        if lag >= SLOW_CALLBACK_SECONDS:
+            log.warning("event loop lagged %.3fs", lag)
+
+
+def _describe_task(task: asyncio.Task | None) -> str:
+    if task is None:
+        return "<no task>"
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", None) or repr(coro)
+    return f"{task.get_name()} ({name})"
+
+
+def _report_block(stalled: float):
+    frame = sys._current_frames().get(_loop_thread_id)
+    stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+    try:
+        task = asyncio.current_task(_loop)
+    except RuntimeError:
+        task = None
+
+    described = _describe_task(task)
+    label = getattr(task.get_coro(), "__qualname__", "<task>") if task is not None else "<callback>"
+    LOOP_BLOCKED.inc(task=label)
+    recent_blocks.append({"at": time.time(), "stalled": round(stalled, 3), "task": described, "stack": stack})
+    log.warning("event loop blocked for %.3fs in %s\n%s", stalled, described, stack)
+
+
+def _watch():
+    reported = None
+    while not _stop.wait(SLOW_CALLBACK_SECONDS / 2):
+        beat = _heartbeat
+        stalled = time.monotonic() - beat - LOOP_LAG_INTERVAL
+        # one report per stall, the stack is the interesting part
+        if stalled >= SLOW_CALLBACK_SECONDS and reported != beat:
+            reported = beat
+            try:
+                _report_block(stalled)
+            except Exception:
+                log.exception("failed to report blocked event loop")
+
+
+def start():
+    """Start the sampler on the running loop and the watchdog thread."""
+    global _task, _watchdog, _loop, _loop_thread_id, _heartbeat
+
+    if not LOOP_MONITOR or _task is not None:
+        return
+
+    _loop = asyncio.get_running_loop()
+    _loop_thread_id = threading.get_ident()
+    _heartbeat = time.monotonic()
+    _stop.clear()
+
+    _task = asyncio.create_task(_sample(), name="loopmon")
+    _watchdog = threading.Thread(target=_watch, name="loopmon-watchdog", daemon=True)
+    _watchdog.start()
+
+
+async def stop():
+    global _task, _watchdog
+
+    _stop.set()
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    _watchdog = None
@@ -0,0 +1,162 @@
+"""
+In-process metrics rendered in the Prometheus text format at /api/metrics.
+
+Updates are plain dict/float operations so they are safe to call on hot paths.
+"""
+import bisect
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def samples(self):
+        return []
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {} if labels else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [("", self.label_names, key, "", value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Either set directly or read from a callback when scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), func=None):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+        self._func = func
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        values = self._values
+        if self._func is not None:
+            # callbacks return a number, or {label values tuple: number} for labelled gauges
+            result = self._func()
+            if result is None:
+                return []
+            values = result if isinstance(result, dict) else {(): result}
+        return [("", self.label_names, key, "", value) for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(("_bucket", self.label_names, key, f'le="{_format_value(float(bound))}"', cumulative))
+            samples.append(("_sum", self.label_names, key, "", total))
+            samples.append(("_count", self.label_names, key, "", cumulative))
+        return samples
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+UPSTREAM_FETCH_SECONDS = Histogram(
+    "svitlo_upstream_fetch_seconds", "Time spent fetching a schedule source.", ("source",)
+)
+UPSTREAM_FETCH_FAILURES = Counter(
+    "svitlo_upstream_fetch_failures_total", "Failed schedule source fetches.", ("source", "reason")
+)
+CACHE_REFRESHES = Counter(
+    "svitlo_schedule_cache_refreshes_total", "Schedule cache updates by where the data came from.", ("source",)
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "svitlo_http_request_duration_seconds", "API request latency.", ("method", "route", "status")
+)
+NOTIFICATIONS = Counter(
+    "svitlo_notifications_total", "Delivery attempts by channel and result.", ("channel", "result")
+)
@@ -1,11 +1,16 @@
+import asyncio
 import json
 import os
 import logging
-from datetime import datetime
-
-from pywebpush import webpush, WebPushException
+from datetime import datetime, time, timedelta
+from functools import wraps
+from itertools import islice
 
 import untils.db_multi as dbM
+import untils.redis_db as redis_un
+from untils import metrics
+from untils import tracing
+from untils import cache
 from untils.parser import parse
 from untils import subcription
 
@@ -15,14 +20,78 @@ BOT_ONLINE = os.getenv("BOT_ONLINE", "false").lower() == "true"
 
 log = logging.getLogger(__name__)
 
+# in-process front cache for the Redis dedup keys, only holds the current day
 notified_slots = set()
+_notified_day = None
 
 
 def _cleanup_notified(current_date):
-    prefix = current_date.strftime("%Y-%m-%d")
-    stale = [key for key in notified_slots if not key.startswith(prefix)]
-    for key in stale:
-        notified_slots.discard(key)
+    global _notified_day
+    if _notified_day != current_date:
+        notified_slots.clear()
+        _notified_day = current_date
+
+
+async def _claim_slot(slot_id: str, current_date) -> bool:
+    """
+    Returns True only for the first worker that claims the reminder slot.
+    Falls back to the in-process set when Redis is unavailable.
+    """
+    if slot_id in notified_slots:
+        return False
+
+    expire_at = datetime.combine(current_date + timedelta(days=1), time.min)
+    try:
+        claimed = await redis_un.claim_key(f"notified:{slot_id}", expire_at)
+    except Exception as exc:
+        log.warning("Redis dedup failed for %s, using local cache: %s", slot_id, exc)
+        claimed = None
+
+    notified_slots.add(slot_id)
+    return claimed is not False
+
+
+# task -> nesting depth of the tracked broadcasts it is running
+_active: dict[asyncio.Task, int] = {}
+
+
+def _tracked(func):
+    """Register the running task so shutdown can wait for the broadcast."""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        task = asyncio.current_task()
+        _active[task] = _active.get(task, 0) + 1
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            depth = _active.pop(task) - 1
+            if depth:
+                _active[task] = depth
+
+    return wrapper
+
+
+async def drain(timeout: float) -> int:
+    """
+    Wait for in-flight broadcasts, cancel whatever is still running at the
+    deadline and return how many were cancelled.
+    """
+    current = asyncio.current_task()
+    pending = [task for task in _active if task is not current]
+    if not pending:
+        return 0
+
+    log.info("waiting for %s in-flight broadcasts", len(pending))
+    _, still_running = await asyncio.wait(pending, timeout=max(0.0, timeout))
+    if not still_running:
+        return 0
+
+    for task in still_running:
+        task.cancel()
+    # give the cancelled reminders a moment to release their slots
+    await asyncio.wait(still_running, timeout=2)
+    log.warning("cancelled %s broadcasts at shutdown", len(still_running))
+    return len(still_running)
 
 
 def _slot_key(current_date, queue, hour, minute=None):
@@ -70,17 +139,27 @@ async def save_all_to_redis():
     await subcription.save_all_to_redis()
 
 
-async def _send_telegram_notifications(text: str, queue: int | None = None):
+def _count(progress: dict | None, key: str):
+    if progress is not None:
+        progress[key] = progress.get(key, 0) + 1
+
+
+@tracing.traced("notify.telegram")
+async def _send_telegram_notifications(
+    text: str, queue: int | None = None, progress: dict | None = None, subs=None
+):
+    tracing.current_span().set(queue=queue if queue is not None else "all")
     if not BOT_ONLINE:
         return 0, []
 
     try:
+        from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
         from bot.untils.notifier import send_notify
     except Exception as exc:
         log.warning("Telegram notifier unavailable: %s", exc)
         return 0, [str(exc)]
 
-    tg_subs = subcription.get_telegram_subs(queue)
+    tg_subs = subcription.iter_telegram_subs(queue) if subs is None else subs
     sent = 0
     errors: list[str] = []
 
@@ -91,19 +170,35 @@ async def _send_telegram_notifications(text: str, queue: int | None = None):
         try:
             await send_notify(int(tg_id), text)
             sent += 1
+            metrics.NOTIFICATIONS.inc(channel="telegram", result="sent")
+            _count(progress, "tg_sent")
         except Exception as exc:
             log.warning("Telegram notify failed for %s: %s", tg_id, exc)
-            await dbM.delete_tg_sub(tg_id)
             errors.append(f"{tg_id}: {exc}")
-
+            # only drop users that blocked the bot or whose chat is gone,
+            # rate limits and server errors say nothing about the subscriber
+            gone = isinstance(exc, TelegramForbiddenError) or (
+                isinstance(exc, TelegramBadRequest) and "chat not found" in str(exc).lower()
+            )
+            if gone:
+                await dbM.delete_tg_sub(tg_id, sub.get("queue"))
+                metrics.NOTIFICATIONS.inc(channel="telegram", result="pruned")
+                _count(progress, "tg_pruned")
+            else:
+                metrics.NOTIFICATIONS.inc(channel="telegram", result="failed")
+                _count(progress, "tg_failed")
+
+    tracing.current_span().set(sent=sent, failed=len(errors))
     return sent, errors
 
 
-async def notify_all(title: str, message: str):
+async def _send_push(subs, title: str, body: str, progress: dict | None = None):
+    from pywebpush import webpush, WebPushException
+
     sent = 0
     errors: list[str] = []
 
-    for raw in subcription.get_push_subs():
+    for raw in subs:
         sub = subcription.normalize_subscription(raw)
         if not sub:
             continue
@@ -113,32 +208,117 @@ async def notify_all(title: str, message: str):
         try:
             webpush(
                 subscription_info=sub,
-                data=json.dumps({"title": title, "body": message}),
+                data=json.dumps({"title": title, "body": body}),
                 vapid_private_key=VAPID_PRIVATE_KEY,
                 vapid_claims={"sub": "mailto:kostantinreksa@gmail.com"},
             )
             sent += 1
+            metrics.NOTIFICATIONS.inc(channel="push", result="sent")
+            _count(progress, "push_sent")
 
         except WebPushException as ex:
             status_code = getattr(getattr(ex, "response", None), "status_code", None)
             log.warning("Push failed for %s...: %s (status=%s)", endpoint[:80], ex, status_code)
 
             if status_code in (404, 410):
-                await dbM.delete_web_sub(endpoint)
+                await dbM.delete_web_sub(endpoint, sub.get("queue"))
+                metrics.NOTIFICATIONS.inc(channel="push", result="pruned")
+                _count(progress, "push_pruned")
                 continue
 
+            metrics.NOTIFICATIONS.inc(channel="push", result="failed")
+            _count(progress, "push_failed")
             errors.append(f"{endpoint[:80]}...: {ex}")
 
         except Exception as ex:
             log.error("Unexpected push error for %s...: %s", endpoint[:80], ex)
+            metrics.NOTIFICATIONS.inc(channel="push", result="failed")
+            _count(progress, "push_failed")
             errors.append(f"{endpoint[:80]}...: {ex}")
 
+    tracing.current_span().set(push_sent=sent, push_failed=len(errors))
+    return sent, errors
+
+
+@_tracked
+@tracing.traced("notify.broadcast")
+async def notify_all(title: str, message: str):
+    sent, errors = await _send_push(subcription.iter_push_subs(), title, message)
     tg_sent, tg_errors = await _send_telegram_notifications(f"{title}\n{message}")
 
     return {"sent": sent, "errors": errors, "tg_sent": tg_sent, "tg_errors": tg_errors}
 
 
+def _checkpointed(subs, checkpoint: dict, progress: dict, pruned_key: str):
+    start, pruned = checkpoint["offset"], progress.get(pruned_key, 0)
+    for tried, sub in enumerate(subs, 1):
+        yield sub
+        # advanced once the sender asks for the next one, i.e. this one was tried;
+        # pruned subscribers left the bucket, so they do not move the position
+        checkpoint["offset"] = start + tried - (progress.get(pruned_key, 0) - pruned)
+
+
+@_tracked
+@tracing.traced("notify.broadcast")
+async def broadcast(
+    title: str,
+    message: str,
+    queues: list[int] | None = None,
+    progress: dict | None = None,
+    checkpoint: dict | None = None,
+):
+    """
+    notify_all restricted to `queues` (None means everyone). `progress` is
+    updated in place per message so a caller can report on a running job.
+
+    `checkpoint` records the finished (queue, channel) steps and how many
+    subscribers of the current one were tried; passing it back resumes an
+    interrupted broadcast there. The offset is positional, a subscriber that
+    left the bucket meanwhile shifts it by one.
+    """
+    targets = [None] if queues is None else [subcription.queue_code_from_input(q) for q in queues]
+    tracing.current_span().set(queues=",".join(map(str, targets)) if queues is not None else "all")
+
+    progress = {} if progress is None else progress
+    checkpoint = {} if checkpoint is None else checkpoint
+    checkpoint.setdefault("done", [])
+    text = f"{title}\n{message}"
+
+    result = {"sent": 0, "errors": [], "tg_sent": 0, "tg_errors": []}
+    for queue in dict.fromkeys(targets):
+        for channel in ("push", "telegram"):
+            step = f"{queue if queue is not None else 'all'}:{channel}"
+            if step in checkpoint["done"]:
+                continue
+            skip = checkpoint.get("offset", 0) if checkpoint.get("step") == step else 0
+            checkpoint.update(step=step, offset=skip)
+
+            if channel == "push":
+                subs = _checkpointed(
+                    islice(subcription.iter_push_subs(queue), skip, None), checkpoint, progress, "push_pruned"
+                )
+                sent, errors = await _send_push(subs, title, message, progress)
+                result["sent"] += sent
+                result["errors"].extend(errors)
+            else:
+                subs = _checkpointed(
+                    islice(subcription.iter_telegram_subs(queue), skip, None), checkpoint, progress, "tg_pruned"
+                )
+                sent, errors = await _send_telegram_notifications(text, queue, progress, subs)
+                result["tg_sent"] += sent
+                result["tg_errors"].extend(errors)
+
+            checkpoint["done"].append(step)
+            checkpoint.update(step=None, offset=0)
+
+    return result
+
+
+@_tracked
+@tracing.traced("notify.check")
 async def check_and_notify():
+    # the reminders are computed from the last cached snapshot
+    tracing.current_span().link(cache.snapshot_context())
     try:
         now = datetime.now()
         _cleanup_notified(now.date())
@@ -159,7 +339,9 @@ async def check_and_notify():
         log.error("check_and_notify failed: %s", e)
 
 
+@tracing.traced("notify.queue")
 async def _process_queue_schedule(queue: int, status: list[int] | None, now: datetime):
+    tracing.current_span().set(queue=queue)
     if not status:
         return
 
@@ -180,8 +362,9 @@ async def _process_queue_schedule(queue: int, status: list[int] | None, now: dat
                 target_minute = 30 if slot_idx % 2 else 0
                 slot_id = _slot_key(now.date(), queue, target_hour, target_minute)
 
-                if slot_id not in notified_slots:
-                    await send_push_all(
+                if await _claim_slot(slot_id, now.date()):
+                    await _send_reminder(
+                        slot_id,
                         title="Скоро відключать світло",
                         body=(
                             f"По графіку (черга {queue_lbl}) світло відключать в "
@@ -189,7 +372,6 @@ async def _process_queue_schedule(queue: int, status: list[int] | None, now: dat
                         ),
                         queue=queue,
                     )
-                    notified_slots.add(slot_id)
                 break
 
             prev_state = state
@@ -202,34 +384,31 @@ async def _process_queue_schedule(queue: int, status: list[int] | None, now: dat
     next_state = _hour_state(status, next_hour)
     slot_id = _slot_key(now.date(), queue, next_hour)
 
-    if current_state == 0 and next_state == 1 and slot_id not in notified_slots:
-        await send_push_all(
+    if current_state == 0 and next_state == 1 and await _claim_slot(slot_id, now.date()):
+        await _send_reminder(
+            slot_id,
             title="Скоро відключать світло",
             body=f"По графіку (черга {queue_lbl}) світло відключать в {next_hour:02d}:00.",
             queue=queue,
         )
-        notified_slots.add(slot_id)
 
 
+async def _send_reminder(slot_id: str, title: str, body: str, queue: int):
+    try:
+        await send_push_all(title=title, body=body, queue=queue)
+    except asyncio.CancelledError:
+        # the slot stays claimed: resending would repeat the reminder for
+        # everyone reached before shutdown, a partial send is the lesser harm
+        log.warning("reminder %s interrupted by shutdown, sent partially", slot_id)
+        raise
+
+
+@_tracked
+@tracing.traced("notify.push")
 async def send_push_all(title: str, body: str, queue: int):
     target_queue = subcription.queue_code_from_input(queue)
-    subs = list(subcription.get_push_subs(target_queue))
-
-    sent = 0
-    for raw in subs:
-        try:
-            sub = subcription.normalize_subscription(raw)
-            if not sub:
-                continue
-            webpush(
-                subscription_info=sub,
-                data=json.dumps({"title": title, "body": body}),
-                vapid_private_key=VAPID_PRIVATE_KEY,
-                vapid_claims={"sub": "mailto:kostantinreksa@gmail.com"},
-            )
-            sent += 1
-        except Exception as ex:
-            log.warning("Push failed: %s", ex)
+    tracing.current_span().set(queue=target_queue)
+    sent, _ = await _send_push(subcription.iter_push_subs(target_queue), title, body)
     tg_sent, tg_errors = await _send_telegram_notifications(f"{title}\n{body}", target_queue)
 
     if tg_errors:
@@ -1,47 +1,247 @@
-import requests
-import json
+"""
+Manual broadcasts from the command line.
 
-import asyncio
+    python -m untils.notify --title "Заголовок" --message "Текст" [--queue 1.1 --queue 2.2]
+    python -m untils.notify --file messages.txt [--batch-size 5]
+    cat messages.jsonl | python -m untils.notify --file -
+    python -m untils.notify --resume JOB_ID      # continue an interrupted job
+    python -m untils.notify                      # interactive, like before
 
+Messages are queued as jobs on /api/notify/jobs and their progress is streamed
+back until every subscriber was tried. With --direct the job is put straight
+on the backend's Redis job queue (needs REDIS_URL, a running backend picks it up).
+
+A --file holds JSON lines ({"title": ..., "message": ..., "queues": ["1.1"]})
+or plain text blocks separated by blank lines, the first line being the title.
+"""
+import argparse
+import asyncio
+import json
 import os
+import sys
+from pathlib import Path
+
 from dotenv import load_dotenv
 
 load_dotenv()
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
 PASS = os.getenv("NOTIFY_PASS")
-# URL твоего сервера FastAPI
-SERVER_URL = "https://likhtarychok.org/"
-
-
-def send_notification(message: str, title: str):
-    """
-    Отправляет уведомление всем подписанным клиентам через /notify
-    """
-    data = {"message": message, "title": title, "pass": PASS}
-    response = requests.post(
-        f"{SERVER_URL}/notify",
-        headers={"Content-Type": "application/json"},
-        data=json.dumps(data)
+SERVER_URL = os.getenv("NOTIFY_SERVER_URL", "https://likhtarychok.org/api")
+
+
+class HttpClient:
+    def __init__(self, server: str, password: str):
+        import aiohttp
+
+        self.server = server.rstrip("/")
+        self.session = aiohttp.ClientSession(
+            headers={"X-Notify-Pass": password or ""},
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10),
+        )
+
+    async def _check(self, response):
+        if response.status >= 400:
+            raise RuntimeError(f"{response.status}: {await response.text()}")
+
+    async def submit(self, title: str, message: str, queues: list | None) -> dict:
+        payload = {"title": title, "message": message, "queues": queues}
+        async with self.session.post(f"{self.server}/notify/jobs", json=payload) as response:
+            await self._check(response)
+            return await response.json()
+
+    async def resume(self, job_id: str) -> dict:
+        async with self.session.post(f"{self.server}/notify/jobs/{job_id}/resume") as response:
+            await self._check(response)
+            return await response.json()
+
+    async def follow(self, job_id: str):
+        async with self.session.get(f"{self.server}/notify/jobs/{job_id}/events") as response:
+            await self._check(response)
+            async for line in response.content:
+                if line.strip():
+                    yield json.loads(line)
+
+    async def close(self):
+        await self.session.close()
+
+
+class DirectClient:
+    """Talks to the job queue in Redis, the same one the HTTP endpoint feeds."""
+
+    async def start(self):
+        sys.path.insert(0, str(BACKEND_DIR))
+        import untils.redis_db as redis_un
+
+        if await redis_un.init_redis() is None:
+            raise RuntimeError("--direct needs a reachable REDIS_URL")
+
+    async def submit(self, title: str, message: str, queues: list | None) -> dict:
+        from untils import notify_jobs
+
+        # no worker runs this process's local queue, a failed push must surface
+        return await notify_jobs.submit(title, message, queues, local_fallback=False)
+
+    async def resume(self, job_id: str) -> dict:
+        from untils import notify_jobs
+
+        job = await notify_jobs.resume(job_id, local_fallback=False)
+        if job is None:
+            raise RuntimeError(f"job {job_id} not found")
+        return job
+
+    async def follow(self, job_id: str):
+        from untils import notify_jobs
+
+        async for job in notify_jobs.watch(job_id):
+            yield job
+
+    async def close(self):
+        import untils.redis_db as redis_un
+
+        await redis_un.close_redis()
+
+
+def parse_messages(text: str, queues: list | None) -> list[dict]:
+    messages = []
+    block: list[str] = []
+
+    def close_block():
+        if block:
+            title, *body = block
+            messages.append({"title": title, "message": "\n".join(body), "queues": queues})
+            block.clear()
+
+    for line in text.splitlines():
+        if line.lstrip().startswith("{"):
+            close_block()
+            item = json.loads(line)
+            messages.append({
+                "title": item.get("title"),
+                "message": item.get("message"),
+                "queues": item.get("queues", queues),
+            })
+        elif line.strip():
+            block.append(line.rstrip())
+        else:
+            close_block()
+    close_block()
+
+    return [item for item in messages if item["title"] and item["message"]]
+
+
+def read_messages(path: str, queues: list | None) -> list[dict]:
+    text = sys.stdin.read() if path == "-" else Path(path).read_text(encoding="utf-8")
+    return parse_messages(text, queues)
+
+
+def _describe(job: dict) -> str:
+    progress = job.get("progress") or {}
+    push = [progress.get(f"push_{key}", 0) for key in ("sent", "failed", "pruned")]
+    tg = [progress.get(f"tg_{key}", 0) for key in ("sent", "failed", "pruned")]
+    return (
+        f"[{job['id'][:8]}] {job['status']}: "
+        f"push {push[0]} ✅ {push[1]} ❌ {push[2]} 🗑, "
+        f"telegram {tg[0]} ✅ {tg[1]} ❌ {tg[2]} 🗑"
     )
 
-    if response.status_code == 200:
-        res = response.json()
-        print(f"✅ Уведомление отправлено {res.get('sent', 0)} клиентам. \n{res.get('msg', '')}")
-    else:
-        print(f"❌ Ошибка {response.status_code}: {response.text}")
 
-async def start():
+async def send(client, item: dict, wait: bool = True) -> dict:
+    job = await client.submit(item["title"], item["message"], item.get("queues"))
+    print(f"📨 [{job['id'][:8]}] «{item['title']}» → {', '.join(job['queues'] or ['всі черги'])}")
+    if not wait:
+        return job
+    return await follow(client, job)
+
+
+async def follow(client, job: dict) -> dict:
+    async for job in client.follow(job["id"]):
+        print(_describe(job))
+    if job.get("error"):
+        print(f"⚠️ [{job['id'][:8]}] {job['error']}")
+    return job
+
+
+async def send_batches(client, messages: list[dict], batch_size: int, wait: bool) -> bool:
+    ok = True
+    for start in range(0, len(messages), batch_size):
+        batch = messages[start:start + batch_size]
+        results = await asyncio.gather(*(send(client, item, wait) for item in batch), return_exceptions=True)
+        for item, result in zip(batch, results):
+            if isinstance(result, Exception):
+                print(f"❌ «{item['title']}»: {result}")
+                ok = False
+            elif wait and result.get("status") != "done":
+                ok = False
+    return ok
+
+
+async def interactive(client, queues: list | None, wait: bool):
     while True:
-        msg = input("Текст уведомления: ").strip()
-        title = input("Заголовок: ").strip()
-        if msg and title:
-            send_notification(msg, title)
-        else:
+        message = (await asyncio.to_thread(input, "Текст уведомления: ")).strip()
+        title = (await asyncio.to_thread(input, "Заголовок: ")).strip()
+        if not message or not title:
             print("⚠️ Сообщение не может быть пустым.")
-        
+            continue
+        try:
+            await send(client, {"title": title, "message": message, "queues": queues}, wait)
+        except Exception as exc:
+            print(f"❌ Ошибка: {exc}")
+
+
+async def start(args) -> bool:
+    if args.direct:
+        client = DirectClient()
+        await client.start()
+    else:
+        client = HttpClient(args.server, args.password)
+
+    queues = args.queue or None
+    wait = not args.no_wait
+    try:
+        if args.resume:
+            job = await client.resume(args.resume)
+            print(f"🔁 [{job['id'][:8]}] «{job['title']}» continues from {job.get('checkpoint') or 'the start'}")
+            if wait:
+                job = await follow(client, job)
+            return job.get("status") in ("done", "queued")
+        if args.message:
+            return await send_batches(client, [{"title": args.title, "message": args.message, "queues": queues}], 1, wait)
+        if args.file:
+            messages = await asyncio.to_thread(read_messages, args.file, queues)
+            return await send_batches(client, messages, args.batch_size, wait)
+        await interactive(client, queues, wait)
+        return True
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--title", help="title of a single message")
+    parser.add_argument("--message", help="text of a single message")
+    parser.add_argument("--file", help="file with messages, - for stdin")
+    parser.add_argument("--queue", action="append", help="target queue like 1.1, repeatable (default: everyone)")
+    parser.add_argument("--batch-size", type=int, default=5, help="jobs submitted and followed at once")
+    parser.add_argument("--resume", metavar="JOB_ID", help="continue a cancelled or failed job from its checkpoint")
+    parser.add_argument("--no-wait", action="store_true", help="only submit, do not follow the progress")
+    parser.add_argument("--server", default=SERVER_URL, help="API base URL (NOTIFY_SERVER_URL)")
+    parser.add_argument("--password", default=PASS, help="NOTIFY_PASS of the server")
+    parser.add_argument("--direct", action="store_true", help="enqueue through Redis instead of HTTP")
+    args = parser.parse_args()
+
+    if args.message and not args.title:
+        parser.error("--message needs --title")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be positive")
 
-        # await asyncio.sleep(3)
-        # os.system("cls")
+    try:
+        ok = asyncio.run(start(args))
+    except KeyboardInterrupt:
+        ok = True
+    sys.exit(0 if ok else 1)
 
 
 if __name__ == "__main__":
-    asyncio.run(start())
\ No newline at end of file
+    main()
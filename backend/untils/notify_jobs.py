@@ -0,0 +1,228 @@
+"""
+Queued manual broadcasts, submitted through /api/notify/jobs or `untils/notify.py --direct`.
+
+With Redis, jobs go to one shared list and are run one at a time by the
+leader, so two announcements never compete for the Telegram rate limit;
+their state is kept under notify:job:<id> so every worker can report on it.
+Without Redis the worker that took the job runs it.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+
+import untils.redis_db as redis_un
+from untils import leader
+from untils import notifier
+from untils import readiness
+from untils import subcription
+
+log = logging.getLogger(__name__)
+
+QUEUE_KEY = "notify:jobs"
+JOB_TTL = int(os.getenv("NOTIFY_JOB_TTL", "86400"))
+# how often a running job publishes its counters
+PROGRESS_INTERVAL = float(os.getenv("NOTIFY_PROGRESS_INTERVAL", "1"))
+POLL_SECONDS = 5
+
+FINISHED = ("done", "failed", "cancelled")
+
+_jobs: dict[str, dict] = {}
+_local: asyncio.Queue = asyncio.Queue()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _key(job_id: str) -> str:
+    return f"notify:job:{job_id}"
+
+
+def parse_queue(value) -> int:
+    code = subcription.queue_code_from_input(value)
+    # queue_code_from_input falls back to 1.1 for anything it does not know
+    if str(value).strip() not in (subcription.queue_label(code), str(code)):
+        raise ValueError(f"unknown queue {value!r}")
+    return code
+
+
+def new_job(title: str, message: str, queues: list | None = None) -> dict:
+    """Raises ValueError for an unknown queue, a typo must not reach queue 1.1."""
+    if queues is not None and not queues:
+        raise ValueError("queues must not be empty, leave it out to notify everyone")
+    return {
+        "id": uuid.uuid4().hex,
+        "title": title,
+        "message": message,
+        # labels, so a job reads the same in the CLI and in Redis
+        "queues": None if queues is None else [
+            subcription.queue_label(parse_queue(queue)) for queue in queues
+        ],
+        "status": "queued",
+        "progress": {},
+        # where an interrupted job stopped, see notifier.broadcast
+        "checkpoint": {},
+        "error": None,
+        "created_at": _now(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+async def _save(job: dict):
+    _jobs[job["id"]] = job
+    try:
+        await redis_un.set_value(_key(job["id"]), json.dumps(job), JOB_TTL)
+    except Exception as exc:
+        log.warning("failed to store notify job %s: %s", job["id"], exc)
+
+
+async def submit(title: str, message: str, queues: list | None = None, local_fallback: bool = True) -> dict:
+    """
+    Queue a broadcast. Without a working Redis queue the job runs in this
+    process, unless local_fallback is off (the CLI has no worker to run it).
+    """
+    job = new_job(title, message, queues)
+    await _enqueue(job, local_fallback)
+    log.info("notify job %s queued for %s", job["id"], job["queues"] or "all queues")
+    return job
+
+
+async def resume(job_id: str, local_fallback: bool = True) -> dict | None:
+    """
+    Queue an interrupted job again; it continues from its checkpoint, so the
+    subscribers it already reached are not notified twice.
+    Returns None for an unknown job, raises ValueError if it can not resume.
+    """
+    job = await get(job_id)
+    if job is None:
+        return None
+    if job["status"] not in ("cancelled", "failed"):
+        raise ValueError(f"job is {job['status']}, only cancelled or failed jobs resume")
+
+    job.update(status="queued", error=None, finished_at=None)
+    await _enqueue(job, local_fallback)
+    log.info("notify job %s queued again from %s", job["id"], job.get("checkpoint"))
+    return job
+
+
+async def _enqueue(job: dict, local_fallback: bool = True):
+    await _save(job)
+    reason = "Redis is not connected"
+    try:
+        queued = await redis_un.push_queue(QUEUE_KEY, json.dumps(job))
+    except Exception as exc:
+        log.warning("Redis job queue failed for notify job %s: %s", job["id"], exc)
+        queued, reason = False, str(exc)
+
+    if queued:
+        return
+    if local_fallback:
+        log.info("running notify job %s on this worker", job["id"])
+        _local.put_nowait(job)
+        return
+
+    job.update(status="failed", error=f"job queue unavailable: {reason}", finished_at=_now())
+    await _save(job)
+    raise RuntimeError(f"notify job queue unavailable: {reason}")
+
+
+async def get(job_id: str) -> dict | None:
+    job = _jobs.get(job_id)
+    if job is not None and job["status"] == "running":
+        # this worker runs it, the local copy is the freshest
+        return job
+
+    try:
+        raw = await redis_un.get_value(_key(job_id))
+    except Exception as exc:
+        log.warning("failed to read notify job %s: %s", job_id, exc)
+        raw = None
+    return json.loads(raw) if raw else job
+
+
+async def watch(job_id: str, interval: float = PROGRESS_INTERVAL):
+    """Yield the job whenever it changes, until it finishes."""
+    last = None
+    while True:
+        job = await get(job_id)
+        if job is None:
+            return
+        if job != last:
+            last = json.loads(json.dumps(job))
+            yield job
+        if job["status"] in FINISHED:
+            return
+        await asyncio.sleep(interval)
+
+
+async def _publish_progress(job: dict):
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        await _save(job)
+
+
+async def run(job: dict):
+    job.update(status="running", started_at=_now())
+    await _save(job)
+    log.info("notify job %s started", job["id"])
+
+    publisher = asyncio.create_task(_publish_progress(job))
+    try:
+        result = await notifier.broadcast(
+            job["title"], job["message"], job["queues"], job["progress"], job.setdefault("checkpoint", {})
+        )
+        job["status"] = "done"
+        # the counters already say how many failed, keep a sample of why
+        job["error"] = "; ".join((result["errors"] + result["tg_errors"])[:5]) or None
+    except asyncio.CancelledError:
+        # the checkpoint is saved below, POST .../resume continues from it
+        job.update(status="cancelled", error="interrupted by shutdown")
+        raise
+    except Exception as exc:
+        log.exception("notify job %s failed", job["id"])
+        job.update(status="failed", error=str(exc))
+    finally:
+        publisher.cancel()
+        job["finished_at"] = _now()
+        await _save(job)
+        log.info("notify job %s %s: %s", job["id"], job["status"], job["progress"])
+
+
+async def _next_job() -> dict | None:
+    # never with a half-loaded subscriber store, nor while shutting down
+    if not readiness.is_ready():
+        await asyncio.sleep(POLL_SECONDS)
+        return None
+
+    if redis_un.get_redis_client() is None:
+        return await _local.get()
+    if not _local.empty():
+        # taken while Redis was failing
+        return _local.get_nowait()
+
+    # one broadcast at a time across workers
+    if not leader.is_leader():
+        await asyncio.sleep(POLL_SECONDS)
+        return None
+
+    raw = await redis_un.pop_queue(QUEUE_KEY, POLL_SECONDS)
+    return json.loads(raw) if raw else None
+
+
+async def run_worker():
+    while True:
+        try:
+            job = await _next_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            log.warning("notify job queue unavailable, retrying: %s", exc)
+            await asyncio.sleep(POLL_SECONDS)
+            continue
+
+        if job is not None:
+            await run(job)
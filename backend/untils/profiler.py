@@ -0,0 +1,170 @@
+"""
+On-demand profiling for live workers, served by /api/admin/profile.
+
+Nothing runs until a capture is requested. A capture samples the stacks of
+every thread from a helper thread (the event loop thread is tagged with the
+task it was running) and takes a tracemalloc snapshot over the same window.
+The result is a zip with collapsed stacks (flamegraph.pl / speedscope) and
+text summaries.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 25
+
+_lock = asyncio.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> list[str]:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _sample(loop, loop_thread_id: int, stop: threading.Event, samples: Counter, own: Counter):
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+    while not stop.wait(SAMPLE_INTERVAL):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+
+            stack = _collapse(frame)
+            root = names.get(thread_id)
+            if root is None:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                root = names.get(thread_id, str(thread_id))
+
+            if thread_id == loop_thread_id:
+                try:
+                    task = asyncio.current_task(loop)
+                except RuntimeError:
+                    task = None
+                root = f"loop;{task.get_name() if task else 'idle'}"
+
+            samples[";".join([root, *stack])] += 1
+            if stack:
+                own[stack[-1]] += 1
+
+
+def _cpu_summary(own: Counter, total: int, seconds: float) -> str:
+    lines = [f"{total} samples over {seconds:.1f}s, {SAMPLE_INTERVAL * 1000:.0f}ms interval", ""]
+    for label, count in own.most_common(50):
+        lines.append(f"{count / total * 100:6.2f}%  {count:6d}  {label}")
+    return "\n".join(lines) + "\n"
+
+
+def _memory_summary(snapshot: tracemalloc.Snapshot) -> str:
+    stats = snapshot.statistics("lineno")
+    total = sum(stat.size for stat in stats)
+    lines = [f"{total / 1024:.1f} KiB traced in {len(stats)} locations", ""]
+    lines.extend(str(stat) for stat in stats[:50])
+    return "\n".join(lines) + "\n"
+
+
+def _snapshot_bytes(snapshot: tracemalloc.Snapshot) -> bytes:
+    # Snapshot.dump only writes to a path
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.snapshot")
+        snapshot.dump(path)
+        with open(path, "rb") as file:
+            return file.read()
+
+
+async def capture(seconds: float) -> bytes:
+    """Profile the worker for `seconds` and return the zipped results."""
+    if _lock.locked():
+        raise ProfilerBusy()
+
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+
+    async with _lock:
+        loop = asyncio.get_running_loop()
+        samples: Counter = Counter()
+        own: Counter = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=_sample,
+            args=(loop, threading.get_ident(), stop, samples, own),
+            name="profiler-sampler",
+            daemon=True,
+        )
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+        log.info("profiling for %.1fs", seconds)
+        started = time.time()
+        sampler.start()
+
+        # the join can wait a sample interval and a snapshot walks every traced
+        # block, neither belongs on the loop being profiled
+        def finish() -> tracemalloc.Snapshot:
+            sampler.join()
+            try:
+                return tracemalloc.take_snapshot()
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            # runs to the end even if the request is cancelled meanwhile
+            snapshot = await asyncio.to_thread(finish)
+
+        total = sum(samples.values()) or 1
+        meta = {
+            "started_at": started,
+            "seconds": seconds,
+            "sample_interval": SAMPLE_INTERVAL,
+            "samples": sum(samples.values()),
+            "pid": os.getpid(),
+        }
+
+        # snapshot filtering and zipping are CPU bound, keep them off the loop
+        def build() -> bytes:
+            filtered = snapshot.filter_traces((
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ))
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr("meta.json", json.dumps(meta, indent=2))
+                archive.writestr("cpu.collapsed", "".join(f"{stack} {count}\n" for stack, count in samples.items()))
+                archive.writestr("cpu_top.txt", _cpu_summary(own, total, seconds))
+                archive.writestr("memory_top.txt", _memory_summary(filtered))
+                archive.writestr("memory.snapshot", _snapshot_bytes(filtered))
+            return buffer.getvalue()
+
+        return await asyncio.to_thread(build)
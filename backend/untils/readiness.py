@@ -0,0 +1,32 @@
+"""Readiness gate for /api/readyz: the worker is ready once every required step is done."""
+
+_started = False
+_pending: set[str] = set()
+_draining = False
+
+
+def require(*steps: str):
+    global _started
+    _started = True
+    _pending.update(steps)
+
+
+def done(step: str):
+    _pending.discard(step)
+
+
+def is_done(step: str) -> bool:
+    return _started and step not in _pending
+
+
+def set_draining():
+    global _draining
+    _draining = True
+
+
+def is_ready() -> bool:
+    return _started and not _pending and not _draining
+
+
+def status() -> dict:
+    return {"ready": is_ready(), "pending": sorted(_pending), "draining": _draining}
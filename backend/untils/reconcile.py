@@ -0,0 +1,160 @@
+"""
+Background consistency check between the in-memory subscribers, Redis and Postgres.
+
+Every store keeps per-queue digests (count and sum of 32-bit md5 prefixes),
+so a pass is one small query per store instead of a full reload. Buckets that
+still differ after RECONCILE_SETTLE seconds (a write may be half way between
+stores) are repaired: this worker's memory from the source of truth (Postgres,
+else Redis), and Redis, by the leader, from the repaired memory. Redis keeps
+one list/hash per kind, so a Redis repair rewrites that kind.
+"""
+import asyncio
+import logging
+import os
+
+import untils.redis_db as redis_un
+from untils import leader
+from untils import metrics
+from untils import readiness
+from untils import subcription
+from untils.lazy import lazy_import
+
+db = lazy_import("db.orm.utils")
+
+log = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "300"))
+RECONCILE_SETTLE = float(os.getenv("RECONCILE_SETTLE", "2"))
+
+KINDS = ("push", "telegram")
+
+REPAIRS = metrics.Counter(
+    "svitlo_reconcile_repairs_total", "Subscriber buckets rewritten by the reconciler.", ("store", "kind")
+)
+DRIFT = metrics.Gauge(
+    "svitlo_reconcile_drift_buckets", "Buckets that differed from the source of truth on the last pass.", ("store",)
+)
+
+
+def _normalize(digests: dict) -> tuple[dict, dict]:
+    """Fold stored queue ids into queue codes, like the in-memory store does on load."""
+    result = {kind: {} for kind in KINDS}
+    stored_ids = {kind: {} for kind in KINDS}
+    for kind in KINDS:
+        for queue_id, (count, total) in (digests.get(kind) or {}).items():
+            if not count:
+                continue
+            code = subcription.queue_code_from_input(queue_id)
+            known_count, known_total = result[kind].get(code, (0, 0))
+            result[kind][code] = (known_count + count, known_total + total)
+            stored_ids[kind].setdefault(code, []).append(queue_id)
+    return result, stored_ids
+
+
+def _diff(left: dict, right: dict) -> list[tuple[str, int]]:
+    return sorted(
+        (kind, queue)
+        for kind in KINDS
+        for queue in set(left[kind]) | set(right[kind])
+        if left[kind].get(queue) != right[kind].get(queue)
+    )
+
+
+async def _check():
+    """(source, stored ids per bucket, memory drift, Redis drift) or None without a second store."""
+    redis_digests = await redis_un.load_subscription_digests()
+
+    if subcription.db_enabled() and (db_digests := await db.subscription_digests()) is not None:
+        source = "db"
+        truth, stored_ids = _normalize(db_digests)
+    elif redis_digests is not None:
+        source = "redis"
+        truth, stored_ids = _normalize(redis_digests)
+    else:
+        return None
+
+    memory_drift = _diff(subcription.digests(), truth)
+    redis_drift = []
+    if source == "db" and redis_digests is not None:
+        redis_drift = _diff(_normalize(redis_digests)[0], truth)
+    return source, stored_ids, memory_drift, redis_drift
+
+
+async def _load_bucket(source: str, kind: str, queue: int, stored_ids: list) -> list:
+    items = []
+    if source == "db":
+        if not stored_ids:
+            return items
+        iterate = db.iter_http_subs if kind == "push" else db.iter_tg_subscribers
+        async for chunk in iterate(queue_ids=stored_ids):
+            items.extend(chunk)
+    else:
+        # not bucketed in Redis, replace_*_bucket drops the other queues
+        iterate = redis_un.iter_push_subscriptions_raw if kind == "push" else redis_un.iter_tg_subscriptions_raw
+        async for chunk in iterate():
+            items.extend(chunk)
+    return items
+
+
+async def reconcile_once() -> dict:
+    report = {"source": None, "memory": [], "redis": []}
+
+    first = await _check()
+    if first is None:
+        return report
+
+    checked = first
+    if first[2] or first[3]:
+        await asyncio.sleep(RECONCILE_SETTLE)
+        checked = await _check()
+        if checked is None:
+            return report
+
+    source, stored_ids, memory_drift, redis_drift = checked
+    memory_drift = [key for key in memory_drift if key in first[2]]
+    redis_drift = [key for key in redis_drift if key in first[3]]
+    report["source"] = source
+    DRIFT.set(len(memory_drift), store="memory")
+    DRIFT.set(len(redis_drift), store="redis")
+
+    for kind, queue in memory_drift:
+        items = await _load_bucket(source, kind, queue, stored_ids[kind].get(queue, []))
+        if kind == "push":
+            subcription.replace_push_bucket(queue, items)
+        else:
+            subcription.replace_telegram_bucket(queue, items)
+        REPAIRS.inc(store="memory", kind=kind)
+        report["memory"].append(f"{kind}:{subcription.queue_label(queue)}")
+
+    # one writer for the shared copy, and only from a memory that matches Postgres again
+    if redis_drift and leader.is_leader():
+        truth = _normalize(await db.subscription_digests())[0]
+        memory = subcription.digests()
+        for kind in sorted({kind for kind, _ in redis_drift}):
+            if memory[kind] != truth[kind]:
+                continue
+            if kind == "push":
+                await redis_un.save_push_subscriptions(subcription.iter_push_subs())
+            else:
+                await redis_un.save_tg_subscriptions(subcription.iter_telegram_subs())
+            REPAIRS.inc(store="redis", kind=kind)
+            report["redis"].append(kind)
+
+    if report["memory"] or report["redis"]:
+        log.warning("reconciled subscriptions against %s: memory=%s redis=%s",
+                    source, report["memory"], report["redis"])
+    return report
+
+
+async def run():
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL)
+        # a half-loaded store always looks drifted
+        if not readiness.is_ready():
+            continue
+        try:
+            await reconcile_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            log.warning("subscription reconcile failed: %s", exc)
@@ -1,6 +1,11 @@
+import asyncio
 import json
 import os
 import logging
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Iterable
 
 import redis.asyncio as redis
 from dotenv import load_dotenv
@@ -12,6 +17,11 @@ log = logging.getLogger(__name__)
 
 _redis_client: redis.Redis | None = None
 
+# items per LRANGE/HSCAN/RPUSH round trip when moving subscriber lists
+CHUNK_SIZE = 1000
+# scratch copies (chunked writes, read snapshots) outlive a crashed worker by this much
+TEMP_KEY_TTL = 600
+
 
 async def init_redis() -> redis.Redis | None:
     global _redis_client
@@ -36,84 +46,456 @@ def get_redis_client() -> redis.Redis | None:
     return _redis_client
 
 
-async def save_push_subscriptions(subscriptions: list[dict]) -> bool:
-    """Persist HTTP push subscriptions to Redis list."""
+async def close_redis():
+    global _redis_client
+
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
+
+
+async def claim_key(key: str, expire_at: datetime) -> bool | None:
+    """
+    Atomically claim a key with SET NX, expiring at the given moment.
+    Returns None when Redis is not configured.
+    """
+    if not _redis_client:
+        return None
+
+    claimed = await _redis_client.set(key, 1, nx=True, exat=int(expire_at.timestamp()))
+    return bool(claimed)
+
+
+_RENEW_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+async def acquire_lock(key: str, token: str, ttl_ms: int) -> bool | None:
+    """Take the lock if it is free or already ours (renewing the lease)."""
+    if not _redis_client:
+        return None
+
+    if await _redis_client.set(key, token, nx=True, px=ttl_ms):
+        return True
+    return bool(await _redis_client.eval(_RENEW_LOCK_SCRIPT, 1, key, token, ttl_ms))
+
+
+async def release_lock(key: str, token: str) -> bool:
     if not _redis_client:
         return False
+    return bool(await _redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, key, token))
 
-    payload = [json.dumps(item) for item in subscriptions if item]
-    await _redis_client.delete("subscriptions")
 
-    if payload:
-        await _redis_client.rpush("subscriptions", *payload)
+async def get_value(key: str) -> str | None:
+    if not _redis_client:
+        return None
+    value = await _redis_client.get(key)
+    return value.decode() if isinstance(value, (bytes, bytearray)) else value
 
-    log.info("Saved %s push subscriptions to Redis", len(payload))
+
+async def set_value(key: str, value: str, ttl: int | None = None) -> bool:
+    if not _redis_client:
+        return False
+    await _redis_client.set(key, value, ex=ttl)
     return True
 
 
-async def save_tg_subscription(tg_id: int, queue_id: int) -> bool:
-    """Save or update a single Telegram subscriber in Redis hash."""
+async def delete_key(key: str) -> bool:
     if not _redis_client:
         return False
+    await _redis_client.delete(key)
+    return True
 
-    data = json.dumps({"id": int(tg_id), "queue": int(queue_id)})
-    await _redis_client.hset("tg_subscriptions", tg_id, data)
+
+async def publish(channel: str, message: str) -> bool:
+    if not _redis_client:
+        return False
+    await _redis_client.publish(channel, message)
     return True
 
 
-async def save_tg_subscriptions(subscriptions: list[dict]) -> bool:
-    """Persist Telegram subscribers to Redis hash."""
+async def push_queue(key: str, value: str) -> bool:
     if not _redis_client:
         return False
+    await _redis_client.rpush(key, value)
+    return True
 
-    if not subscriptions:
-        await _redis_client.delete("tg_subscriptions")
-        log.info("Saved 0 telegram subscriptions to Redis")
-        return True
 
-    mapping = {str(item.get("id")): json.dumps(item) for item in subscriptions if item.get("id")}
-    if not mapping:
+async def pop_queue(key: str, timeout: float) -> str | None:
+    """Blocking pop from the head of a list, None on timeout or without Redis."""
+    if not _redis_client:
+        return None
+    item = await _redis_client.blpop([key], timeout=timeout)
+    if item is None:
+        return None
+    value = item[1]
+    return value.decode() if isinstance(value, (bytes, bytearray)) else value
+
+
+async def listen(channel: str, callback, retry_delay: float = 5.0):
+    """
+    Call `callback(message)` for every message published to the channel.
+    Resubscribes after connection errors; returns at once without Redis.
+    """
+    while _redis_client:
+        pubsub = _redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(channel)
+            async for item in pubsub.listen():
+                data = item.get("data")
+                if isinstance(data, (bytes, bytearray)):
+                    data = data.decode()
+                await callback(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            log.warning("Redis listener for %s failed, retrying: %s", channel, exc)
+            await asyncio.sleep(retry_delay)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+
+async def save_schedule_cache(snapshot: dict) -> bool:
+    """Share the merged schedule snapshot with workers that do not scrape themselves."""
+    if not _redis_client:
         return False
 
-    await _redis_client.delete("tg_subscriptions")
-    await _redis_client.hset("tg_subscriptions", mapping=mapping)
-    log.info("Saved %s telegram subscriptions to Redis", len(mapping))
+    # expires so a cold cluster never serves a schedule older than a few refreshes
+    await _redis_client.set("schedule_snapshot", json.dumps(snapshot), ex=900)
     return True
 
 
-async def load_push_subscriptions_raw() -> list[str]:
+async def load_schedule_cache() -> dict | None:
+    if not _redis_client:
+        return None
+
+    raw = await _redis_client.get("schedule_snapshot")
+    if not raw:
+        return None
+    return json.loads(raw)
+
+
+def _batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _decode(item):
+    return item.decode() if isinstance(item, (bytes, bytearray)) else item
+
+
+# per-queue "<queue>:count" / "<queue>:sum" fields, kept next to the subscriber
+# keys so the reconciler can compare stores without reading every subscriber
+PUSH_DIGEST_KEY = "subscriptions:digest"
+TG_DIGEST_KEY = "tg_subscriptions:digest"
+
+
+def _add_digest(digests: dict, queue, item_hash: int):
+    state = digests.setdefault(queue, [0, 0])
+    state[0] += 1
+    state[1] += item_hash
+
+
+# the subscriber write and its digest update run as one script, so two workers
+# writing the same id can not count the change twice or not at all
+_DIGEST_LUA = """
+local function bump(key, item, sign, item_hash)
+    local ok, decoded = pcall(cjson.decode, item)
+    if ok and type(decoded) == "table" and type(decoded["queue"]) == "number" then
+        local queue = string.format("%d", decoded["queue"])
+        redis.call("hincrby", key, queue .. ":count", sign)
+        redis.call("hincrby", key, queue .. ":sum", sign * item_hash)
+    end
+end
+"""
+
+# KEYS: hash, digest; ARGV: tg id, value, item hash
+_SAVE_TG_SCRIPT = _DIGEST_LUA + """
+local previous = redis.call("hget", KEYS[1], ARGV[1])
+redis.call("hset", KEYS[1], ARGV[1], ARGV[2])
+if previous then
+    bump(KEYS[2], previous, -1, tonumber(ARGV[3]))
+end
+bump(KEYS[2], ARGV[2], 1, tonumber(ARGV[3]))
+return 1
+"""
+
+# KEYS: hash, digest; ARGV: tg id, item hash
+_DELETE_TG_SCRIPT = _DIGEST_LUA + """
+local previous = redis.call("hget", KEYS[1], ARGV[1])
+if not previous then
+    return 0
+end
+redis.call("hdel", KEYS[1], ARGV[1])
+bump(KEYS[2], previous, -1, tonumber(ARGV[2]))
+return 1
+"""
+
+# KEYS: list, digest; ARGV: value, item hash
+_ADD_PUSH_SCRIPT = _DIGEST_LUA + """
+redis.call("rpush", KEYS[1], ARGV[1])
+bump(KEYS[2], ARGV[1], 1, tonumber(ARGV[2]))
+return 1
+"""
+
+# KEYS: list, digest; ARGV: value, item hash
+_DELETE_PUSH_SCRIPT = _DIGEST_LUA + """
+local removed = redis.call("lrem", KEYS[1], 0, ARGV[1])
+if removed > 0 then
+    bump(KEYS[2], ARGV[1], -removed, tonumber(ARGV[2]))
+end
+return removed
+"""
+
+
+@asynccontextmanager
+async def _temp_key(prefix: str):
+    """Scratch key for a chunked write, removed when the write does not get to the rename."""
+    key = f"{prefix}:tmp:{uuid.uuid4().hex}"
+    try:
+        yield key
+    finally:
+        # a no-op after a successful rename
+        try:
+            await _redis_client.delete(key)
+        except Exception as exc:
+            log.warning("failed to drop %s, it expires in %ss: %s", key, TEMP_KEY_TTL, exc)
+
+
+async def _replace_list(key: str, tmp_key: str, count: int, digest_key: str, digests: dict):
+    # the subscribers and their digest change in one step
+    async with _redis_client.pipeline(transaction=True) as pipe:
+        if count:
+            pipe.rename(tmp_key, key)
+            # RENAME keeps the scratch key's TTL
+            pipe.persist(key)
+        else:
+            pipe.delete(key)
+        pipe.delete(digest_key)
+        mapping = {}
+        for queue, (queue_count, total) in digests.items():
+            mapping[f"{queue}:count"] = queue_count
+            mapping[f"{queue}:sum"] = total
+        if mapping:
+            pipe.hset(digest_key, mapping=mapping)
+        await pipe.execute()
+
+
+async def load_subscription_digests() -> dict | None:
+    """{"push"|"telegram": {queue: (count, hash sum)}}, None without Redis."""
     if not _redis_client:
-        return []
+        return None
 
-    subs = await _redis_client.lrange("subscriptions", 0, -1)
-    return [item.decode() if isinstance(item, (bytes, bytearray)) else item for item in subs]
+    result = {}
+    for kind, key in (("push", PUSH_DIGEST_KEY), ("telegram", TG_DIGEST_KEY)):
+        fields = {_decode(name): int(value) for name, value in (await _redis_client.hgetall(key)).items()}
+        result[kind] = {}
+        for name, value in fields.items():
+            queue, field = name.rsplit(":", 1)
+            if field == "count" and value and queue.isdigit():
+                result[kind][int(queue)] = (value, fields.get(f"{queue}:sum", 0))
+    return result
 
 
-async def load_tg_subscriptions_raw() -> list[str]:
+async def save_push_subscriptions(subscriptions: Iterable[dict]) -> bool:
+    """
+    Persist HTTP push subscriptions to Redis list. Written in chunks to a
+    temporary key and renamed, so readers never see a half-written list.
+    """
     if not _redis_client:
-        return []
+        return False
 
-    subs = await _redis_client.hvals("tg_subscriptions")
-    return [item.decode() if isinstance(item, (bytes, bytearray)) else item for item in subs]
+    from untils import subcription
+
+    count = 0
+    digests: dict = {}
+    items = (item for item in subscriptions if item)
+    async with _temp_key("subscriptions") as tmp_key:
+        for batch in _batched(items, CHUNK_SIZE):
+            for item in batch:
+                _add_digest(digests, item.get("queue"), subcription.push_item_hash(item))
+            await _redis_client.rpush(tmp_key, *(json.dumps(item) for item in batch))
+            if not count:
+                await _redis_client.expire(tmp_key, TEMP_KEY_TTL)
+            count += len(batch)
+
+        await _replace_list("subscriptions", tmp_key, count, PUSH_DIGEST_KEY, digests)
+
+    log.info("Saved %s push subscriptions to Redis", count)
+    return True
+
+
+async def save_push_subscription(sub: dict) -> bool:
+    """
+    Save or replace a single web push subscription, matched by endpoint.
+    Only this item changes, what other workers wrote to the list stays.
+    """
+    if not _redis_client:
+        return False
+
+    from untils import subcription
+
+    await delete_push_subscription(sub.get("endpoint"))
+    await _redis_client.eval(
+        _ADD_PUSH_SCRIPT, 2, "subscriptions", PUSH_DIGEST_KEY, json.dumps(sub), subcription.push_item_hash(sub)
+    )
+    return True
+
+
+async def save_tg_subscription(tg_id: int, queue_id: int) -> bool:
+    """Save or update a single Telegram subscriber in Redis hash."""
+    if not _redis_client:
+        return False
+
+    from untils import subcription
+
+    data = json.dumps({"id": int(tg_id), "queue": int(queue_id)})
+    await _redis_client.eval(
+        _SAVE_TG_SCRIPT, 2, "tg_subscriptions", TG_DIGEST_KEY, tg_id, data, subcription.tg_item_hash(tg_id)
+    )
+    return True
+
+
+async def save_tg_subscriptions(subscriptions: Iterable[dict]) -> bool:
+    """Persist Telegram subscribers to Redis hash, chunked like the push list."""
+    if not _redis_client:
+        return False
+
+    from untils import subcription
+
+    count = 0
+    digests: dict = {}
+    items = (item for item in subscriptions if item and item.get("id"))
+    async with _temp_key("tg_subscriptions") as tmp_key:
+        for batch in _batched(items, CHUNK_SIZE):
+            for item in batch:
+                _add_digest(digests, item.get("queue"), subcription.tg_item_hash(item["id"]))
+            await _redis_client.hset(tmp_key, mapping={str(item["id"]): json.dumps(item) for item in batch})
+            if not count:
+                await _redis_client.expire(tmp_key, TEMP_KEY_TTL)
+            count += len(batch)
+
+        await _replace_list("tg_subscriptions", tmp_key, count, TG_DIGEST_KEY, digests)
+
+    log.info("Saved %s telegram subscriptions to Redis", count)
+    return True
+
+
+@asynccontextmanager
+async def _snapshot(key: str):
+    """
+    Yield a private copy of `key` to page through: LRANGE offsets and HSCAN
+    cursors on the live key would mix two versions when another worker swaps
+    or trims it mid-read.
+    """
+    snapshot = f"{key}:snapshot:{uuid.uuid4().hex}"
+    try:
+        await _redis_client.copy(key, snapshot)
+    except redis.ResponseError as exc:
+        # COPY needs Redis 6.2, older servers are read live (the loaders still dedup)
+        log.warning("Redis COPY unavailable, reading %s live: %s", key, exc)
+        snapshot = None
+
+    if snapshot is None:
+        yield key
+        return
+
+    # a crashed reader must not leave the copy behind
+    await _redis_client.expire(snapshot, TEMP_KEY_TTL)
+    try:
+        yield snapshot
+    finally:
+        await _redis_client.delete(snapshot)
+
+
+async def iter_push_subscriptions_raw(chunk_size: int = CHUNK_SIZE):
+    if not _redis_client:
+        return
+
+    async with _snapshot("subscriptions") as key:
+        start = 0
+        while True:
+            subs = await _redis_client.lrange(key, start, start + chunk_size - 1)
+            if not subs:
+                return
+            yield [_decode(item) for item in subs]
+            if len(subs) < chunk_size:
+                return
+            start += chunk_size
+
+
+async def iter_tg_subscriptions_raw(chunk_size: int = CHUNK_SIZE):
+    """HSCAN may return a field more than once, callers dedup by id."""
+    if not _redis_client:
+        return
+
+    async with _snapshot("tg_subscriptions") as key:
+        cursor = 0
+        while True:
+            cursor, data = await _redis_client.hscan(key, cursor, count=chunk_size)
+            if data:
+                yield [_decode(item) for item in data.values()]
+            if not cursor:
+                return
+
+
+async def load_push_subscriptions_raw() -> list[str]:
+    subs = []
+    async for chunk in iter_push_subscriptions_raw():
+        subs.extend(chunk)
+    return subs
+
+
+async def load_tg_subscriptions_raw() -> list[str]:
+    subs = []
+    async for chunk in iter_tg_subscriptions_raw():
+        subs.extend(chunk)
+    return subs
 
 
 async def load_all_into_subcription() -> bool:
     """
-    Load push and Telegram subscriptions from Redis straight into the in-memory
-    caches maintained by untils.subcription.
+    Stream push and Telegram subscriptions from Redis straight into the
+    in-memory caches maintained by untils.subcription.
     """
     if not _redis_client:
         return False
 
     from untils import subcription
 
-    push_raw = await load_push_subscriptions_raw()
-    tg_raw = await load_tg_subscriptions_raw()
+    subcription.replace_push_subscriptions([])
+    subcription.replace_telegram_subscriptions([])
 
-    subcription.replace_push_subscriptions(push_raw)
-    subcription.replace_telegram_subscriptions(tg_raw)
+    push_count = tg_count = 0
+    seen: set[str] = set()
+    async for chunk in iter_push_subscriptions_raw():
+        subcription.add_push_subscriptions(chunk, seen)
+        push_count += len(chunk)
+    async for chunk in iter_tg_subscriptions_raw():
+        subcription.add_telegram_subscriptions(chunk)
+        tg_count += len(chunk)
 
-    log.info("Loaded subscriptions from Redis: push=%s, tg=%s", len(push_raw), len(tg_raw))
+    log.info("Loaded subscriptions from Redis: push=%s, tg=%s", push_count, tg_count)
 
     return True
 
@@ -122,7 +504,12 @@ async def delete_tg_subscription(tg_id: int) -> bool:
     """Remove a Telegram subscriber from Redis cache by Telegram id."""
     if not _redis_client:
         return False
-    await _redis_client.hdel("tg_subscriptions", tg_id)
+
+    from untils import subcription
+
+    await _redis_client.eval(
+        _DELETE_TG_SCRIPT, 2, "tg_subscriptions", TG_DIGEST_KEY, tg_id, subcription.tg_item_hash(tg_id)
+    )
     return True
 
 async def delete_push_subscription(endpoint: str) -> bool:
@@ -130,24 +517,25 @@ async def delete_push_subscription(endpoint: str) -> bool:
     if not _redis_client:
         return False
 
-    raw_subs = await load_push_subscriptions_raw()
-    updated_subs = []
-    found = False
-
-    for s in raw_subs:
-        try:
-            if json.loads(s).get("endpoint") == endpoint:
-                found = True
+    matches = []
+    async for chunk in iter_push_subscriptions_raw():
+        for s in chunk:
+            try:
+                if json.loads(s).get("endpoint") == endpoint:
+                    matches.append(s)
+            except (json.JSONDecodeError, AttributeError):
                 continue
-            updated_subs.append(s)
-        except (json.JSONDecodeError, AttributeError):
-            updated_subs.append(s)
-
-    if found:
-        await _redis_client.delete("subscriptions")
-        if updated_subs:
-            await _redis_client.rpush("subscriptions", *updated_subs)
+
+    from untils import subcription
+
+    # removed after the scan so the paging offsets stay valid
+    for s in matches:
+        await _redis_client.eval(
+            _DELETE_PUSH_SCRIPT, 2, "subscriptions", PUSH_DIGEST_KEY, s, subcription.push_item_hash(json.loads(s))
+        )
+
+    if matches:
         log.info("Deleted push subscription: %s", endpoint)
         return True
 
-    return False
\ No newline at end of file
+    return False
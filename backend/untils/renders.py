@@ -0,0 +1,171 @@
+"""
+Per-queue schedule answers for the bot's /status command.
+
+Built once per cache refresh by a cache listener, then shared by every user
+of the queue: a text summary and a small PNG strip of the day (pure Python,
+no imaging dependency). After the first upload the Telegram file_id is kept,
+so later answers resend it instead of the image.
+"""
+import hashlib
+import struct
+import zlib
+from datetime import datetime
+
+from untils.variebles import QUEUE_LABELS
+
+# queue -> {"version", "status", "text", "png", "file_id", "rendered_at"}
+_renders: dict[int, dict] = {}
+
+SLOT_WIDTH = 8
+BAR_HEIGHT = 28
+PAD = 8
+SCALE = 2
+
+# palette indexes
+BG, POWER, OUTAGE, INK, UNKNOWN = range(5)
+PALETTE = bytes([
+    0xFF, 0xFF, 0xFF,
+    0x4C, 0xAF, 0x50,
+    0xE5, 0x39, 0x35,
+    0x61, 0x61, 0x61,
+    0xE0, 0xE0, 0xE0,
+])
+
+# 3x5 digits for the hour labels, one row per string
+_DIGITS = {
+    "0": ("111", "101", "101", "101", "111"),
+    "1": ("010", "110", "010", "010", "111"),
+    "2": ("111", "001", "111", "100", "111"),
+    "3": ("111", "001", "111", "001", "111"),
+    "4": ("101", "101", "111", "001", "001"),
+    "5": ("111", "100", "111", "001", "111"),
+    "6": ("111", "100", "111", "101", "111"),
+    "7": ("111", "001", "010", "010", "010"),
+    "8": ("111", "101", "111", "101", "111"),
+    "9": ("111", "101", "111", "001", "111"),
+}
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(pixels: list[bytearray]) -> bytes:
+    """8-bit palette PNG from rows of palette indexes."""
+    height = len(pixels)
+    width = len(pixels[0])
+    raw = b"".join(b"\x00" + bytes(row) for row in pixels)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+        _chunk(b"PLTE", PALETTE),
+        _chunk(b"IDAT", zlib.compress(raw, 9)),
+        _chunk(b"IEND", b""),
+    ])
+
+
+def _draw_text(pixels: list[bytearray], text: str, x: int, y: int):
+    for char in text:
+        for row, bits in enumerate(_DIGITS[char]):
+            for col, bit in enumerate(bits):
+                if bit == "1":
+                    for dy in range(SCALE):
+                        start = x + col * SCALE
+                        pixels[y + row * SCALE + dy][start:start + SCALE] = bytes([INK]) * SCALE
+        x += 4 * SCALE
+
+
+def render_png(status: list[int]) -> bytes:
+    slots = len(status)
+    slot_width = max(1, SLOT_WIDTH * 48 // slots)
+    width = slots * slot_width + PAD * 2
+    label_y = PAD + BAR_HEIGHT + 8
+    height = label_y + 5 * SCALE + PAD
+    pixels = [bytearray([BG]) * width for _ in range(height)]
+
+    for idx, value in enumerate(status):
+        color = UNKNOWN if value is None else OUTAGE if value else POWER
+        start = PAD + idx * slot_width
+        for y in range(PAD, PAD + BAR_HEIGHT):
+            # one pixel gap between slots keeps half hours readable
+            pixels[y][start:start + slot_width - 1] = bytes([color]) * (slot_width - 1)
+
+    for hour in range(0, 25, 3):
+        x = PAD + hour * slots // 24 * slot_width
+        for y in range(PAD + BAR_HEIGHT + 1, PAD + BAR_HEIGHT + 5):
+            pixels[y][min(x, width - 1)] = INK
+        if hour % 6 == 0:
+            label = str(hour)
+            label_width = len(label) * 4 * SCALE - SCALE
+            left = min(max(0, x - label_width // 2), width - label_width)
+            _draw_text(pixels, label, left, label_y)
+
+    return encode_png(pixels)
+
+
+def _clock(slot: int, slots: int) -> str:
+    minutes = slot * 24 * 60 // slots
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def outage_intervals(status: list[int]) -> list[tuple[str, str]]:
+    intervals = []
+    start = None
+    for idx, value in enumerate(list(status) + [0]):
+        if value and start is None:
+            start = idx
+        elif not value and start is not None:
+            intervals.append((_clock(start, len(status)), _clock(idx, len(status))))
+            start = None
+    return intervals
+
+
+def render_text(queue: int, status: list[int], rendered_at: datetime) -> str:
+    label = QUEUE_LABELS.get(queue, str(queue))
+    intervals = outage_intervals(status)
+    lines = [f"Черга {label}, графік на сьогодні"]
+    if intervals:
+        lines.append("Відключення:")
+        lines.extend(f"• {start}–{end}" for start, end in intervals)
+    else:
+        lines.append("Відключень не заплановано")
+    lines.append(f"Оновлено о {rendered_at:%H:%M}")
+    return "\n".join(lines)
+
+
+def current_state(status: list[int], now: datetime) -> str:
+    slot = (now.hour * 60 + now.minute) * len(status) // (24 * 60)
+    return "Зараз світло за графіком вимкнене" if status[slot] else "Зараз світло за графіком є"
+
+
+async def record_snapshot(statuses: dict[int, list[int] | None], scraped: bool = True):
+    """Cache listener: re-render only the queues whose schedule changed."""
+    now = datetime.now()
+    for queue, status in statuses.items():
+        if not status:
+            continue
+
+        version = hashlib.md5(bytes(1 if value else 0 for value in status)).hexdigest()
+        current = _renders.get(queue)
+        if current and current["version"] == version and current["rendered_at"].date() == now.date():
+            continue
+
+        _renders[queue] = {
+            "version": version,
+            "status": list(status),
+            "text": render_text(queue, status, now),
+            "png": render_png(status),
+            "file_id": None,
+            "rendered_at": now,
+        }
+
+
+def get_render(queue: int) -> dict | None:
+    return _renders.get(queue)
+
+
+def remember_file_id(queue: int, version: str, file_id: str):
+    render = _renders.get(queue)
+    # the schedule may have changed while the photo was uploading
+    if render and render["version"] == version:
+        render["file_id"] = file_id
@@ -0,0 +1,23 @@
+"""Schedule sources: adapters, their registry and the fetch scheduler."""
+from untils.sources.base import HttpSource, Source
+from untils.sources.registry import get_source, get_sources, register, unregister
+from untils.sources.scheduler import Snapshot, collect, health, merge, set_retry_callback, stop_retries
+from untils.sources.ztoe import ZtoeSource, register_defaults
+
+register_defaults()
+
+__all__ = [
+    "HttpSource",
+    "Snapshot",
+    "Source",
+    "ZtoeSource",
+    "collect",
+    "get_source",
+    "get_sources",
+    "health",
+    "merge",
+    "register",
+    "set_retry_callback",
+    "stop_retries",
+    "unregister",
+]
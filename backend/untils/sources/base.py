@@ -0,0 +1,55 @@
+import os
+
+
+class Source:
+    """
+    A schedule provider. fetch() downloads the raw document, extract() turns
+    it into {queue code: slots} (0 power, 1 outage) for the queues it covers;
+    missing queues are None or left out.
+    """
+
+    name = "source"
+    # lower wins when several healthy sources have the same queue
+    priority = 100
+    timeout = 30.0
+    # minimum seconds between two fetches
+    interval = 300.0
+    # older results are not merged any more
+    max_age = float(os.getenv("SOURCE_MAX_AGE", str(3 * 3600)))
+
+    def __init__(self, name: str | None = None, priority: int | None = None,
+                 timeout: float | None = None, interval: float | None = None):
+        if name is not None:
+            self.name = name
+        if priority is not None:
+            self.priority = priority
+        if timeout is not None:
+            self.timeout = timeout
+        if interval is not None:
+            self.interval = interval
+
+    async def fetch(self, session) -> str:
+        raise NotImplementedError
+
+    def extract(self, raw: str) -> dict[int, list[int] | None]:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+
+class HttpSource(Source):
+    """Source backed by one GET request."""
+
+    url = ""
+    headers = {"User-Agent": "Mozilla/5.0"}
+
+    def __init__(self, url: str | None = None, **kwargs):
+        super().__init__(**kwargs)
+        if url is not None:
+            self.url = url
+
+    async def fetch(self, session) -> str:
+        async with session.get(self.url, headers=self.headers) as resp:
+            resp.raise_for_status()
+            return await resp.text()
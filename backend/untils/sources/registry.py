@@ -0,0 +1,21 @@
+from untils.sources.base import Source
+
+_sources: dict[str, Source] = {}
+
+
+def register(source: Source) -> Source:
+    """Add or replace a source, keyed by its name."""
+    _sources[source.name] = source
+    return source
+
+
+def unregister(name: str) -> Source | None:
+    return _sources.pop(name, None)
+
+
+def get_source(name: str) -> Source | None:
+    return _sources.get(name)
+
+
+def get_sources() -> list[Source]:
+    return sorted(_sources.values(), key=lambda source: source.priority)
@@ -0,0 +1,229 @@
+"""
+Fetches every registered source concurrently and merges the results.
+
+Each source keeps its own health: a source is refetched once its interval has
+passed, and a failing one is retried by the leader on its own timer with a
+doubling delay, publishing the merge through the retry callback once it is back. The merge
+takes every queue from the best healthy source that has it, falling back to
+the last good result of the others as long as it is younger than max_age.
+"""
+import asyncio
+import logging
+import time
+
+from untils import leader
+from untils import metrics
+from untils import tracing
+from untils.sources.base import Source
+from untils.sources.registry import get_sources
+from untils.variebles import QUEUE_LABELS
+
+log = logging.getLogger(__name__)
+
+# first retry of a failing source, doubled per failure up to its interval
+RETRY_DELAY = 60.0
+
+# async callback run after a retry brought a source back (the cache re-merges)
+_retry_callback = None
+_retries: dict[str, asyncio.Task] = {}
+
+
+class SourceState:
+    def __init__(self, source: Source):
+        self.source = source
+        # None until the first fetch finished
+        self.healthy: bool | None = None
+        self.failures = 0
+        self.last_attempt = 0.0
+        self.last_error: str | None = None
+        self.fetched_at = 0.0
+        self.result: dict[int, list[int] | None] | None = None
+
+    def is_due(self, now: float) -> bool:
+        # the refresh job runs on a fixed cadence, a little slack keeps it from skipping a turn
+        return now - self.last_attempt >= self.source.interval * 0.9
+
+    def retry_delay(self) -> float:
+        return min(self.source.interval, RETRY_DELAY * 2 ** (self.failures - 1))
+
+    def is_fresh(self, now: float) -> bool:
+        return self.result is not None and now - self.fetched_at <= self.source.max_age
+
+
+class Snapshot:
+    """Merged schedule: slots and originating source per queue code."""
+
+    def __init__(self, statuses: dict[int, list[int] | None], origins: dict[int, str], fetched_at: float):
+        self.statuses = statuses
+        self.origins = origins
+        self.fetched_at = fetched_at
+
+    def to_dict(self) -> dict:
+        return {
+            "statuses": {str(queue): status for queue, status in self.statuses.items()},
+            "origins": {str(queue): origin for queue, origin in self.origins.items()},
+            "fetched_at": self.fetched_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Snapshot":
+        return cls(
+            {int(queue): status for queue, status in data.get("statuses", {}).items()},
+            {int(queue): origin for queue, origin in data.get("origins", {}).items()},
+            data.get("fetched_at", 0.0),
+        )
+
+
+_states: dict[str, SourceState] = {}
+
+
+def _current_states() -> list[SourceState]:
+    states = []
+    for source in get_sources():
+        state = _states.get(source.name)
+        if state is None or state.source is not source:
+            state = _states[source.name] = SourceState(source)
+        states.append(state)
+    return states
+
+
+def set_retry_callback(callback):
+    global _retry_callback
+    _retry_callback = callback
+
+
+def _schedule_retry(state: SourceState):
+    # the leader owns the shared snapshot; followers, including live parses
+    # and their fallback scrapes, keep reading it from Redis
+    if not leader.is_leader():
+        return
+    pending = _retries.get(state.source.name)
+    if pending is not None and not pending.done():
+        return
+    _retries[state.source.name] = asyncio.create_task(_retry(state, state.retry_delay()))
+
+
+async def _retry(state: SourceState, delay: float):
+    await asyncio.sleep(delay)
+    name = state.source.name
+    _retries.pop(name, None)
+    if _states.get(name) is not state or not leader.is_leader():
+        # unregistered, replaced or leadership lost meanwhile
+        return
+
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        # a new failure schedules the next, longer retry
+        await _run(state, session)
+
+    if state.healthy and _retry_callback is not None and leader.is_leader():
+        log.info("source %s is back after a retry", name)
+        try:
+            await _retry_callback()
+        except Exception as exc:
+            log.warning("retry callback for %s failed: %s", name, exc)
+
+
+async def stop_retries():
+    for task in list(_retries.values()):
+        task.cancel()
+    _retries.clear()
+
+
+def _failed(state: SourceState, reason: str, exc: BaseException):
+    state.healthy = False
+    state.failures += 1
+    state.last_error = f"{type(exc).__name__}: {exc}"
+    metrics.UPSTREAM_FETCH_FAILURES.inc(source=state.source.name, reason=reason)
+    log.warning("source %s failed (%s): %s", state.source.name, reason, state.last_error)
+    _schedule_retry(state)
+
+
+async def _run(state: SourceState, session):
+    source = state.source
+    state.last_attempt = time.time()
+    started = time.perf_counter()
+
+    with tracing.span("source.fetch", source=source.name):
+        try:
+            raw = await asyncio.wait_for(source.fetch(session), timeout=source.timeout)
+        except asyncio.TimeoutError as exc:
+            return _failed(state, "timeout", exc)
+        except Exception as exc:
+            return _failed(state, "http", exc)
+        finally:
+            metrics.UPSTREAM_FETCH_SECONDS.observe(time.perf_counter() - started, source=source.name)
+
+        try:
+            # HTML parsing is CPU bound, keep it off the loop
+            result = await asyncio.to_thread(source.extract, raw)
+            if not any(result.values()):
+                raise ValueError("no queue found in the document")
+        except Exception as exc:
+            return _failed(state, "parse", exc)
+
+    state.result = result
+    state.fetched_at = time.time()
+    state.healthy = True
+    state.failures = 0
+    state.last_error = None
+
+
+def merge() -> Snapshot:
+    now = time.time()
+    ranked = sorted(_current_states(), key=lambda state: (not state.healthy, state.source.priority))
+
+    statuses: dict[int, list[int] | None] = {}
+    origins: dict[int, str] = {}
+    fetched_at = 0.0
+    for queue in QUEUE_LABELS:
+        statuses[queue] = None
+        for state in ranked:
+            status = state.result.get(queue) if state.is_fresh(now) else None
+            if status:
+                statuses[queue] = status
+                origins[queue] = state.source.name
+                fetched_at = max(fetched_at, state.fetched_at)
+                break
+
+    return Snapshot(statuses, origins, fetched_at)
+
+
+async def collect(force: bool = False) -> Snapshot:
+    """Fetch the sources that are due (all of them with force) and merge."""
+    now = time.time()
+    due = [state for state in _current_states() if force or state.is_due(now)]
+
+    if due:
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(_run(state, session) for state in due))
+
+    return merge()
+
+
+def health() -> dict[str, dict]:
+    now = time.time()
+    return {
+        state.source.name: {
+            "healthy": state.healthy,
+            "priority": state.source.priority,
+            "failures": state.failures,
+            "last_error": state.last_error,
+            "last_attempt": state.last_attempt or None,
+            "age": round(now - state.fetched_at, 1) if state.fetched_at else None,
+        }
+        for state in _current_states()
+    }
+
+
+metrics.Gauge(
+    "svitlo_source_healthy",
+    "1 when the schedule source's last fetch succeeded.",
+    ("source",),
+    func=lambda: {
+        (state.source.name,): int(state.healthy) for state in _states.values() if state.healthy is not None
+    },
+)
@@ -0,0 +1,49 @@
+import os
+
+from untils import tools
+from untils.sources.base import HttpSource
+from untils.sources.registry import register
+from untils.variebles import QUEUE_LABELS
+
+ZTOE_URL = os.getenv("ZTOE_URL", "https://www.ztoe.com.ua/unhooking-search.php")
+# same page served from elsewhere, used when ztoe.com.ua is down
+ZTOE_MIRROR_URL = os.getenv("ZTOE_MIRROR_URL")
+ZTOE_TIMEOUT = float(os.getenv("ZTOE_TIMEOUT", "30"))
+ZTOE_INTERVAL = float(os.getenv("ZTOE_INTERVAL", "300"))
+
+
+class ZtoeSource(HttpSource):
+    """
+    ztoe.com.ua unhooking page: the fourth table has a row per queue, with
+    2 or 3 lead cells (see tools.bias_from_index) before the schedule slots.
+    """
+
+    name = "ztoe"
+    url = ZTOE_URL
+    priority = 10
+    timeout = ZTOE_TIMEOUT
+    interval = ZTOE_INTERVAL
+
+    def extract(self, raw: str) -> dict[int, list[int] | None]:
+        from bs4 import BeautifulSoup
+
+        tables = BeautifulSoup(raw, "html.parser").find_all("table")
+        if len(tables) < 4:
+            raise ValueError(f"expected the schedule in table 4, page has {len(tables)}")
+        rows = tables[3].select("tr")
+
+        result = {}
+        for queue in QUEUE_LABELS:
+            index = tools.queue_to_index(queue)
+            if 1 + index >= len(rows):
+                result[queue] = None
+                continue
+            cells = rows[1 + index].select("td")[tools.bias_from_index(index):]
+            result[queue] = tools.cell_statuses(cells) or None
+        return result
+
+
+def register_defaults():
+    register(ZtoeSource())
+    if ZTOE_MIRROR_URL:
+        register(ZtoeSource(name="ztoe_mirror", url=ZTOE_MIRROR_URL, priority=20))
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+from datetime import date, datetime, timedelta
+
+from untils import subcription
+from untils.lazy import lazy_import
+from untils.variebles import QUEUE_LABELS
+
+db = lazy_import("db.orm.utils")
+
+log = logging.getLogger(__name__)
+
+WEEK_DAYS = 7
+
+# (queue_id, day) -> (outage_minutes, longest_outage_minutes)
+_daily: dict[tuple[int, date], tuple[int, int]] = {}
+_rollup_version = 0
+
+_cached_payload: dict | None = None
+_cached_key: tuple | None = None
+
+
+def summarize(status: list[int]) -> tuple[int, int]:
+    """Total and longest outage in minutes for one day of slots."""
+    if not status:
+        return 0, 0
+
+    slot_minutes = 24 * 60 // len(status)
+    total = longest = run = 0
+    for value in status:
+        if value:
+            run += 1
+            total += 1
+            longest = max(longest, run)
+        else:
+            run = 0
+    return total * slot_minutes, longest * slot_minutes
+
+
+def _prune(today: date):
+    oldest = today - timedelta(days=WEEK_DAYS - 1)
+    for key in [key for key in _daily if key[1] < oldest]:
+        del _daily[key]
+
+
+async def load():
+    """Warm the rollups for the current week from Postgres."""
+    global _rollup_version
+
+    today = date.today()
+    rows = await db.get_daily_stats(today - timedelta(days=WEEK_DAYS - 1), today)
+    for row in rows:
+        _daily[(row.queue_id, row.day)] = (row.outage_minutes, row.longest_outage_minutes)
+    _rollup_version += 1
+    log.info("loaded %s daily stats rollups", len(rows))
+
+
+async def record_snapshot(statuses: dict[int, list[int] | None], scraped: bool = True):
+    """Cache listener: refresh today's rollup for the queues that changed."""
+    global _rollup_version
+
+    today = date.today()
+    _prune(today)
+
+    changed = []
+    for queue_id, status in statuses.items():
+        if not status:
+            continue
+
+        summary = summarize(status)
+        if _daily.get((queue_id, today)) == summary:
+            continue
+
+        _daily[(queue_id, today)] = summary
+        changed.append({
+            "queue_id": queue_id,
+            "day": today,
+            "outage_minutes": summary[0],
+            "longest_outage_minutes": summary[1],
+        })
+
+    if not changed:
+        return
+
+    _rollup_version += 1
+    if scraped:
+        await db.upsert_daily_stats(changed)
+
+
+def _build_payload(today: date) -> dict:
+    queues = []
+    for queue_id, label in QUEUE_LABELS.items():
+        day_total, day_longest = _daily.get((queue_id, today), (0, 0))
+
+        week = [_daily[(queue_id, today - timedelta(days=offset))]
+                for offset in range(WEEK_DAYS)
+                if (queue_id, today - timedelta(days=offset)) in _daily]
+
+        queues.append({
+            "queue": label,
+            "today": {
+                "outage_hours": round(day_total / 60, 2),
+                "longest_outage_hours": round(day_longest / 60, 2),
+            },
+            "week": {
+                "days": len(week),
+                "outage_hours": round(sum(total for total, _ in week) / 60, 2),
+                "longest_outage_hours": round(max((longest for _, longest in week), default=0) / 60, 2),
+            },
+            "subscribers": {
+                "push": len(subcription.push_subscriptions.get(queue_id, ())),
+                "telegram": len(subcription.telegram_subscriptions.get(queue_id, ())),
+            },
+        })
+
+    return {"date": today.isoformat(), "queues": queues}
+
+
+def get_stats() -> dict:
+    """
+    Cached stats payload, rebuilt only when rollups, subscriptions or the day change.
+    The version is a content hash, so every worker hands out the same ETag.
+    """
+    global _cached_payload, _cached_key
+
+    today = date.today()
+    key = (today, _rollup_version, subcription.version())
+    if _cached_payload is None or _cached_key != key:
+        payload = _build_payload(today)
+        payload["version"] = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+        payload["generated_at"] = datetime.now().isoformat(timespec="seconds")
+        _cached_payload = payload
+        _cached_key = key
+
+    return _cached_payload
@@ -1,29 +1,89 @@
+import hashlib
 import json
 import re
 import logging
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Dict, Iterator, List, Tuple, Optional, Any
 
 import untils.redis_db as redis_un
-import db.orm.utils as db
-from db.orm.session import AsyncSessionLocal
-from db.orm.models import Subscription
-from sqlalchemy import select
-
+from untils.lazy import lazy_import
 from untils.variebles import QUEUE_LABELS
 
+db = lazy_import("db.orm.utils")
+
 log = logging.getLogger(__name__)
 
 # In-memory storages
 push_subscriptions: Dict[int, List[dict]] = {}
 telegram_subscriptions: Dict[int, List[dict]] = {}
+# Telegram id -> queue, kept in step with telegram_subscriptions
+_telegram_queues: Dict[int, int] = {}
 
 _redis_client = None
 
+# bumped on every change so derived views (stats) know when to rebuild
+_version = 0
+
+# (kind, queue) -> [count, sum of item hashes], kept in step with the buckets
+# so the reconciler compares stores in O(buckets)
+_digests: Dict[Tuple[str, int], List[int]] = {}
+
+def version() -> int:
+    return _version
+
+
+def _bump_version():
+    global _version
+    _version += 1
+
+
+def push_item_hash(sub: dict) -> int:
+    """32-bit md5 prefix, the same value Postgres computes in db.orm.utils.subscription_digests."""
+    keys = sub.get("keys") or {}
+    raw = f"{sub.get('endpoint')}\n{keys.get('p256dh') or sub.get('p256dh')}\n{keys.get('auth') or sub.get('auth')}"
+    return int(hashlib.md5(raw.encode()).hexdigest()[:8], 16)
+
+
+def tg_item_hash(tg_id) -> int:
+    return int(hashlib.md5(str(int(tg_id)).encode()).hexdigest()[:8], 16)
+
+
+def _track(kind: str, queue: int, item_hash: int, sign: int = 1):
+    state = _digests.setdefault((kind, queue), [0, 0])
+    state[0] += sign
+    state[1] += sign * item_hash
+
+
+def _reset_digests(kind: str, queue: Optional[int] = None):
+    for key in [key for key in _digests if key[0] == kind and queue in (None, key[1])]:
+        del _digests[key]
+
+
+def digests() -> Dict[str, Dict[int, Tuple[int, int]]]:
+    """{"push"|"telegram": {queue: (count, hash sum)}} for the non-empty buckets."""
+    result: Dict[str, Dict[int, Tuple[int, int]]] = {"push": {}, "telegram": {}}
+    for (kind, queue), (count, total) in _digests.items():
+        if count:
+            result[kind][queue] = (count, total)
+    return result
+
+
 def set_redis_client(client):
     global _redis_client
     _redis_client = client
 
 
+# False in offline mode or after init_db failed: the DB layer is then never imported
+_db_enabled = True
+
+def set_db_enabled(enabled: bool):
+    global _db_enabled
+    _db_enabled = enabled
+
+
+def db_enabled() -> bool:
+    return _db_enabled
+
+
 def queue_code_from_input(value) -> int:
     default_queue = 11
     if value is None:
@@ -80,6 +140,14 @@ def get_push_subs(queue: Optional[int] = None) -> List[dict]:
     return push_subscriptions.get(queue_code, [])
 
 
+def iter_push_subs(queue: Optional[int] = None) -> Iterator[dict]:
+    """Like get_push_subs, without building a combined copy of every bucket."""
+    buckets = list(push_subscriptions.values()) if queue is None else [get_push_subs(queue)]
+    for bucket in buckets:
+        # copy per bucket: senders may drop dead subscriptions while iterating
+        yield from list(bucket)
+
+
 def find_push_subscription(endpoint: str) -> Tuple[Optional[int], Optional[int]]:
     for queue_id, bucket in push_subscriptions.items():
         for idx, item in enumerate(bucket):
@@ -92,18 +160,29 @@ def remember_push_subscription(sub_data: dict):
     queue = queue_code_from_input(sub_data.get("queue"))
     sub_data["queue"] = queue
     push_subscriptions.setdefault(queue, []).append(sub_data)
+    _track("push", queue, push_item_hash(sub_data))
+    _bump_version()
+
 
+def _buckets_for(store: dict, queue: Optional[int]) -> list:
+    # the hinted bucket first, so pruning during a broadcast does not scan every queue
+    if queue is None or queue not in store:
+        return list(store.items())
+    return [(queue, store[queue])] + [item for item in store.items() if item[0] != queue]
 
-def forget_push_subscription(endpoint: str):
+
+def forget_push_subscription(endpoint: str, queue: Optional[int] = None):
     if not endpoint:
         return False
-    for queue_id, bucket in list(push_subscriptions.items()):
+    for queue_id, bucket in _buckets_for(push_subscriptions, queue):
         for idx, item in enumerate(bucket):
             if (item or {}).get("endpoint") == endpoint:
                 try:
                     bucket.pop(idx)
+                    _track("push", queue_id, push_item_hash(item), -1)
                 except Exception:
                     pass
+                _bump_version()
                 return True
     return False
 
@@ -149,6 +228,13 @@ def remember_telegram_subscription(sub_data: dict):
 
     queue = normalized["queue"]
     telegram_subscriptions.setdefault(queue, []).append(normalized)
+    _telegram_queues[normalized["id"]] = queue
+    _track("telegram", queue, tg_item_hash(normalized["id"]))
+    _bump_version()
+
+
+def telegram_queue(tg_id: int) -> Optional[int]:
+    return _telegram_queues.get(tg_id)
 
 
 def get_telegram_subs(queue: Optional[int] = None) -> List[dict]:
@@ -162,13 +248,28 @@ def get_telegram_subs(queue: Optional[int] = None) -> List[dict]:
     return telegram_subscriptions.get(queue_code, [])
 
 
-def forget_telegram_subscription(identifier: int):
+def iter_telegram_subs(queue: Optional[int] = None) -> Iterator[dict]:
+    buckets = list(telegram_subscriptions.values()) if queue is None else [get_telegram_subs(queue)]
+    for bucket in buckets:
+        yield from list(bucket)
+
+
+def forget_telegram_subscription(identifier: int, queue: Optional[int] = None):
     removed = False
-    for queue_id, bucket in list(telegram_subscriptions.items()):
+    if queue is None:
+        queue = _telegram_queues.get(identifier)
+    _telegram_queues.pop(identifier, None)
+    for queue_id, bucket in _buckets_for(telegram_subscriptions, queue):
         filtered = [item for item in bucket if (item or {}).get("id") != identifier]
         if len(filtered) != len(bucket):
             telegram_subscriptions[queue_id] = filtered
+            _track("telegram", queue_id, tg_item_hash(identifier), len(filtered) - len(bucket))
             removed = True
+            if queue is not None:
+                # ids are unique per worker, the hinted bucket was the right one
+                break
+    if removed:
+        _bump_version()
     return removed
 
 
@@ -219,23 +320,85 @@ def normalize_subscription(sub: Any):
     return normalized
 
 
-def replace_push_subscriptions(raw_subscriptions: List[Any]):
-    global push_subscriptions
-    push_subscriptions = {}
+def add_push_subscriptions(raw_subscriptions: List[Any], seen: Optional[set] = None):
+    """`seen` collects endpoints across chunks so a repeated one is added once."""
     for item in raw_subscriptions:
         normalized = normalize_subscription(item)
+        if not normalized:
+            continue
+        if seen is not None:
+            if normalized["endpoint"] in seen:
+                continue
+            seen.add(normalized["endpoint"])
+        remember_push_subscription(normalized)
+
+
+def add_telegram_subscriptions(raw_subscriptions: List[Any]):
+    """
+    Bulk load from the Redis hash or the tg_sub table. A repeated id (HSCAN
+    can return a field twice) is found through the id index, so only the
+    rare duplicate pays for a bucket scan.
+    """
+    for item in raw_subscriptions:
+        normalized = normalize_tg_subscription(item)
         if normalized:
-            remember_push_subscription(normalized)
+            if normalized["id"] in _telegram_queues:
+                forget_telegram_subscription(normalized["id"])
+            telegram_subscriptions.setdefault(normalized["queue"], []).append(normalized)
+            _telegram_queues[normalized["id"]] = normalized["queue"]
+            _track("telegram", normalized["queue"], tg_item_hash(normalized["id"]))
+    _bump_version()
+
+
+def replace_push_subscriptions(raw_subscriptions: List[Any]):
+    global push_subscriptions
+    push_subscriptions = {}
+    _reset_digests("push")
+    _bump_version()
+    add_push_subscriptions(raw_subscriptions)
 
 
 def replace_telegram_subscriptions(raw_subscriptions: List[Any]):
     global telegram_subscriptions
     telegram_subscriptions = {}
-    for item in raw_subscriptions:
-        remember_telegram_subscription(item)
+    _telegram_queues.clear()
+    _reset_digests("telegram")
+    _bump_version()
+    add_telegram_subscriptions(raw_subscriptions)
+
+
+def replace_push_bucket(queue: int, raw_subscriptions: List[Any]):
+    """Swap one queue's push subscribers, how the reconciler repairs a drifted bucket."""
+    push_subscriptions[queue] = []
+    _reset_digests("push", queue)
+    _bump_version()
+    add_push_subscriptions(
+        [item for item in raw_subscriptions if (normalize_subscription(item) or {}).get("queue") == queue],
+        set(),
+    )
+
+
+def replace_telegram_bucket(queue: int, raw_subscriptions: List[Any]):
+    for item in telegram_subscriptions.get(queue, []):
+        # a subscriber that moved on keeps its new queue in the index
+        if _telegram_queues.get(item["id"]) == queue:
+            del _telegram_queues[item["id"]]
+    telegram_subscriptions[queue] = []
+    _reset_digests("telegram", queue)
+    add_telegram_subscriptions(
+        item for item in raw_subscriptions
+        if (normalize_tg_subscription(item) or {}).get("queue") == queue
+    )
 
 
 async def save_subscription_db(queue: int, sub_payload: dict):
+    if not _db_enabled:
+        return False
+
+    from sqlalchemy import select
+    from db.orm.models import Subscription
+    from db.orm.session import AsyncSessionLocal
+
     if AsyncSessionLocal is None:
         log.warning("save_subscription_db(): DB not available, skipping.")
         return False
@@ -286,8 +449,33 @@ async def save_all_to_redis():
         return
 
     try:
-        await redis_un.save_push_subscriptions(list(get_push_subs()))
-        await redis_un.save_tg_subscriptions(list(get_telegram_subs()))
+        await redis_un.save_push_subscriptions(iter_push_subs())
+        await redis_un.save_tg_subscriptions(iter_telegram_subs())
+    except Exception as exc:
+        log.warning("Redis sync failed, disabling cache: %s", exc)
+        _redis_client = None
+
+
+async def save_push_to_redis(sub_data: dict):
+    """Persist one push subscription, unlike save_all_to_redis it keeps other workers' changes."""
+    global _redis_client
+    if not _redis_client:
+        return
+
+    try:
+        await redis_un.save_push_subscription(sub_data)
+    except Exception as exc:
+        log.warning("Redis sync failed, disabling cache: %s", exc)
+        _redis_client = None
+
+
+async def delete_push_from_redis(endpoint: str):
+    global _redis_client
+    if not _redis_client:
+        return
+
+    try:
+        await redis_un.delete_push_subscription(endpoint)
     except Exception as exc:
         log.warning("Redis sync failed, disabling cache: %s", exc)
         _redis_client = None
@@ -298,6 +486,9 @@ async def load_subscriptions_from_storage(force_db: bool = False):
 
     push_subscriptions = {}
     telegram_subscriptions = {}
+    _telegram_queues.clear()
+    _digests.clear()
+    _bump_version()
     loaded = False
 
     if _redis_client and not force_db:
@@ -307,16 +498,17 @@ async def load_subscriptions_from_storage(force_db: bool = False):
             log.warning("Failed to load subscriptions from Redis, disabling cache: %s", exc)
             _redis_client = None
 
-    if loaded:
+    if loaded or not _db_enabled:
         return
 
     log.info("Loading subscriptions from DB (Redis unavailable or force_db=True).")
 
-    db_subs = await db.get_all_http_sub()
-    replace_push_subscriptions(db_subs or [])
+    # streamed chunk by chunk, only the in-memory store holds every subscriber
+    async for chunk in db.iter_http_subs():
+        add_push_subscriptions(chunk)
 
-    tg_db_subs = await db.get_all_tg_subscribers()
-    replace_telegram_subscriptions([{"id": sub.tg_id, "queue": sub.queue_id} for sub in tg_db_subs or []])
+    async for chunk in db.iter_tg_subscribers():
+        add_telegram_subscriptions(chunk)
 
     if _redis_client:
         await save_all_to_redis()
@@ -329,10 +521,11 @@ async def remove_push_subscription(endpoint: str):
 
     removed = forget_push_subscription(endpoint)
 
-    try:
-        await db.delete_sub(endpoint)
-    except Exception as ex:
-        log.warning("delete_sub failed for %s...: %s", endpoint[:80], ex)
+    if _db_enabled:
+        try:
+            await db.delete_sub(endpoint)
+        except Exception as ex:
+            log.warning("delete_sub failed for %s...: %s", endpoint[:80], ex)
 
-    await save_all_to_redis()
+    await delete_push_from_redis(endpoint)
     return removed
@@ -0,0 +1,15 @@
+import os
+
+# self-hosted Bot API server, or a fake one in bench/fanout.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+
+def make_session():
+    """aiogram session for the configured Bot API server, None for api.telegram.org."""
+    if not TELEGRAM_API_URL:
+        return None
+
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    return AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
@@ -1,7 +1,5 @@
-import aiohttp
-import asyncio
-
-from bs4 import BeautifulSoup
+# BeautifulSoup is imported where used: only the scraping worker needs it,
+# and it is slow to import
 
 def queue_to_index(n: int) -> int:
     x = n // 10
@@ -16,29 +14,25 @@ def index_to_queue(idx: int) -> int:
 def bias_from_index(idx: int) -> int:
     return 2 if idx % 2 == 0 else 3
 
-async def get_status(queue, bias):
-    SITE_URL = "https://www.ztoe.com.ua/unhooking-search.php"
+def cell_statuses(cells) -> list[int]:
+    """0 (power on) / 1 (outage) for each parsed <td>, by its background colour."""
+    status = []
 
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
+    for cell in cells:
+        style = cell.get("style", "")
+        color = None
 
-    timeout = aiohttp.ClientTimeout(total=30)
+        for part in style.split(";"):
+            part = part.strip()
+            if part.startswith("background"):
+                color = part.split(":", 1)[1].strip()
+                break
 
-    html = ""
+        status.append(0 if color == "#ffffff" else 1)
+    return status
 
-    try:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(SITE_URL, headers=headers) as resp:
-                resp.raise_for_status()
-                html = await resp.text()
-    except asyncio.TimeoutError:
-        return None
-    except aiohttp.ClientError:
-        return None
-    
-    soup = BeautifulSoup(html, "html.parser")
-    table = soup.find_all("table")[3].select("tr")
+def cells_to_status(text: str) -> list[int]:
+    """Turn the scraped <td> cells into 0 (power on) / 1 (outage) slots."""
+    from bs4 import BeautifulSoup
 
-    cells = table[1 + queue].select("td")[bias:]
-    return "".join(str(td) for td in cells)
\ No newline at end of file
+    return cell_statuses(BeautifulSoup(text, "html.parser"))
@@ -0,0 +1,219 @@
+"""
+Lightweight tracing for the scrape -> parse -> notify pipeline.
+
+Spans nest through a context variable, so tasks spawned inside a span inherit
+it. Finished spans are buffered and flushed in the background to a JSONL file
+(TRACE_FILE) and/or an OTLP/HTTP JSON endpoint (TRACE_OTLP_ENDPOINT). With
+neither set, span() hands out a shared no-op span.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+log = logging.getLogger(__name__)
+
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "svitlo-backend")
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "5"))
+TRACE_BUFFER_LIMIT = 10_000
+
+ENABLED = bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_buffer: list["Span"] = []
+_task: asyncio.Task | None = None
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "links", "error")
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.links: list[tuple[str, str]] = []
+        self.error: str | None = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def link(self, context: tuple[str, str] | None):
+        """Point at a span from another trace, e.g. the snapshot a reminder was computed from."""
+        if context:
+            self.links.append(context)
+
+    @property
+    def context(self) -> tuple[str, str]:
+        return self.trace_id, self.span_id
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "links": [{"trace_id": trace_id, "span_id": span_id} for trace_id, span_id in self.links],
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    context = None
+
+    def set(self, **attributes):
+        pass
+
+    def link(self, context):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    if not ENABLED:
+        yield _NOOP
+        return
+
+    current = Span(name, _current.get(), attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current.reset(token)
+        current.end_ns = time.time_ns()
+        if len(_buffer) < TRACE_BUFFER_LIMIT:
+            _buffer.append(current)
+
+
+def traced(name: str):
+    """Run the decorated coroutine function inside a span."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_span() -> "Span | _NoopSpan":
+    return _current.get() or _NOOP
+
+
+def current_context() -> tuple[str, str] | None:
+    current = _current.get()
+    return current.context if current else None
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_payload(spans: list[Span]) -> dict:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [
+                    {
+                        "traceId": item.trace_id,
+                        "spanId": item.span_id,
+                        "parentSpanId": item.parent_id or "",
+                        "name": item.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(item.start_ns),
+                        "endTimeUnixNano": str(item.end_ns),
+                        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in item.attributes.items()],
+                        "links": [{"traceId": trace_id, "spanId": span_id} for trace_id, span_id in item.links],
+                        "status": {"code": 2, "message": item.error} if item.error else {"code": 1},
+                    }
+                    for item in spans
+                ],
+            }],
+        }]
+    }
+
+
+def _write_file(lines: str):
+    with open(TRACE_FILE, "a", encoding="utf-8") as file:
+        file.write(lines)
+
+
+async def flush():
+    global _buffer
+
+    if not _buffer:
+        return
+
+    spans, _buffer = _buffer, []
+
+    if TRACE_FILE:
+        lines = "".join(json.dumps(item.to_dict(), ensure_ascii=False) + "\n" for item in spans)
+        try:
+            await asyncio.to_thread(_write_file, lines)
+        except OSError as exc:
+            log.warning("failed to write traces to %s: %s", TRACE_FILE, exc)
+
+    if TRACE_OTLP_ENDPOINT:
+        import aiohttp
+
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+                async with session.post(TRACE_OTLP_ENDPOINT, json=_otlp_payload(spans)) as resp:
+                    resp.raise_for_status()
+        except Exception as exc:
+            log.warning("failed to export %s spans: %s", len(spans), exc)
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(TRACE_FLUSH_INTERVAL)
+        await flush()
+
+
+def start():
+    global _task
+
+    if ENABLED and _task is None:
+        _task = asyncio.create_task(_flush_loop())
+
+
+async def stop():
+    global _task
+
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    await flush()
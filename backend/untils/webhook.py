@@ -0,0 +1,112 @@
+"""
+Webhook mode for the Telegram bots (BOT_MODE=webhook).
+
+Each bot registers its dispatcher under a name and gets the route
+POST /api/tg/<name>/webhook on the FastAPI app. Telegram's secret token header
+is checked, the update is acknowledged right away and processed in a task,
+at most WEBHOOK_CONCURRENCY at a time. Every worker can serve the route, so
+no worker has to hold a long poll.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from untils import leader
+
+log = logging.getLogger(__name__)
+
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_BASE_URL = (os.getenv("WEBHOOK_BASE_URL") or "").rstrip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "32"))
+# beyond this many queued updates Telegram is asked to retry later
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+
+ENABLED = BOT_MODE == "webhook" and bool(WEBHOOK_BASE_URL)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# name -> (bot, dispatcher)
+_bots: dict[str, tuple] = {}
+_pending: set[asyncio.Task] = set()
+_semaphore = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+
+if BOT_MODE == "webhook" and not WEBHOOK_BASE_URL:
+    log.warning("BOT_MODE=webhook needs WEBHOOK_BASE_URL, falling back to polling")
+
+
+def secret_for(name: str, token: str) -> str:
+    """Same value in every worker, without having to share one more env var."""
+    key = (WEBHOOK_SECRET or token).encode()
+    return hmac.new(key, name.encode(), hashlib.sha256).hexdigest()
+
+
+def url_for(name: str) -> str:
+    return f"{WEBHOOK_BASE_URL}/api/tg/{name}/webhook"
+
+
+async def serve(name: str, bot, dp):
+    """Route updates for `bot` to `dp` through the webhook instead of polling."""
+    _bots[name] = (bot, dp)
+
+    # setWebhook is rate limited and the registration is global, one worker is enough
+    if leader.is_leader():
+        await bot.set_webhook(
+            url=url_for(name),
+            secret_token=secret_for(name, bot.token),
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(100, WEBHOOK_CONCURRENCY),
+        )
+        log.info("webhook for %s set to %s", name, url_for(name))
+
+
+async def _process(bot, dp, update):
+    async with _semaphore:
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            log.exception("failed to process update %s", update.update_id)
+
+
+async def handle(name: str, request: Request):
+    entry = _bots.get(name)
+    if entry is None:
+        return JSONResponse({"ok": False}, status_code=404)
+
+    bot, dp = entry
+    received = request.headers.get(SECRET_HEADER, "")
+    if not hmac.compare_digest(received, secret_for(name, bot.token)):
+        return JSONResponse({"ok": False}, status_code=401)
+
+    if len(_pending) >= WEBHOOK_MAX_PENDING:
+        # Telegram redelivers on errors, this is our backpressure
+        return JSONResponse({"ok": False}, status_code=503)
+
+    from aiogram.types import Update
+
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except Exception as exc:
+        log.warning("malformed update for %s: %s", name, exc)
+        return JSONResponse({"ok": False}, status_code=400)
+
+    task = asyncio.create_task(_process(bot, dp, update))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+    return Response(status_code=200)
+
+
+async def stop(timeout: float = 5):
+    """Let queued updates finish, used on shutdown."""
+    _bots.clear()
+    if not _pending:
+        return
+
+    _, still_running = await asyncio.wait(set(_pending), timeout=timeout)
+    for task in still_running:
+        task.cancel()